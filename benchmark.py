@@ -0,0 +1,253 @@
+"""Benchmarks for the hot paths of parts_list on synthetic catalogs.
+
+Generates a products file of the requested size and shape, times loading,
+saving, pricing and the listbox queries on it, measures the memory held by
+its items, and prints the results as JSON so that runs can be compared.
+
+    python2 benchmark.py --parts 100000 --compounds 20000 --depth 5
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from timeit import default_timer
+
+from parts_list import (Products, iter_items, load_items_from_file,
+                        save_items_to_file)
+
+
+def generate_catalog(filename, parts, compounds, depth=3, fanout=4,
+                     sharing=0.2, seed=0):
+    """Write a synthetic products file.
+
+    The compounds are split evenly into depth levels.  Each compound lists
+    fanout distinct components from the level below it (parts for the
+    first level); with probability sharing a component is drawn from the
+    first 1% of that level instead of all of it, so that a few popular
+    sub-assemblies are shared by many compounds.  Lines are written in a
+    shuffled order, so compounds often refer to items defined later.
+
+    generate_catalog(str, int, int, int, int, float, int) -> None
+    """
+    rand = random.Random(seed)
+    levels = [['P{0:08d}'.format(n) for n in xrange(parts)]]
+    lines = ['{0}, Part {1}, {2}'.format(itemID, n, rand.randint(1, 100000))
+             for n, itemID in enumerate(levels[0])]
+    per_level = max(1, compounds // max(1, depth))
+    made = 0
+    for level in xrange(1, depth + 1):
+        if made >= compounds:
+            break
+        below = levels[-1]
+        popular = below[:max(1, len(below) // 100)]
+        count = per_level if level < depth else compounds - made
+        count = min(count, compounds - made)
+        ids = ['C{0}_{1:08d}'.format(level, n) for n in xrange(count)]
+        for itemID in ids:
+            chosen = set()
+            while len(chosen) < min(fanout, len(below)):
+                pool = popular if rand.random() < sharing else below
+                chosen.add(rand.choice(pool))
+            items = ','.join('{0}:{1}'.format(c, rand.randint(1, 4))
+                             for c in sorted(chosen))
+            lines.append('{0}, Assembly {1}, {2}'.format(itemID, level, items))
+        made += count
+        levels.append(ids)
+    rand.shuffle(lines)
+    f = open(filename, 'w')
+    f.write('\n'.join(lines) + '\n')
+    f.close()
+
+
+def best_time(function, repeat, setup=None):
+    """Return the fastest of repeat timed calls of function, in seconds.
+    setup, if given, is called untimed before each call."""
+    best = None
+    for _ in xrange(repeat):
+        if setup is not None:
+            setup()
+        start = default_timer()
+        function()
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+class DictItem(object):
+    """An item laid out as Part and Compound were before they had slots:
+    a __dict__ each, uninterned IDs and a list of (ID, qty) pairs for a
+    compound's items.  Only used to compare memory footprints."""
+
+    def __init__(self, itemID, name, cost, items, products):
+        self._ID = itemID
+        self._name = name
+        self._products = products
+        if items is None:
+            self._cost = cost
+        else:
+            self._itemlist = items
+
+
+def footprint(objects):
+    """Return the bytes held by objects and everything they refer to,
+    counting shared objects once and leaving out Products objects.
+
+    footprint(iter(object)) -> int
+    """
+    seen = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, Products):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for name in cls.__dict__.get('__slots__', ()):
+                    stack.append(getattr(obj, name))
+    return total
+
+
+def headless_items_list(products):
+    """Return Controller.items_list for products without creating any
+    widgets, or None if Tkinter is not installed."""
+    try:
+        from parts_list_gui import Controller
+    except ImportError:
+        return None
+    # items_list only uses _products, so skip __init__ and its widgets.
+    controller = Controller.__new__(Controller)
+    controller._products = products
+    return controller.items_list
+
+
+def run(args):
+    """Generate a catalog and time each hot path on it.
+
+    run(argparse.Namespace) -> dict
+    """
+    workdir = tempfile.mkdtemp(prefix='parts_bench')
+    try:
+        catalog = os.path.join(workdir, 'catalog.txt')
+        generate_catalog(catalog, args.parts, args.compounds, args.depth,
+                         args.fanout, args.sharing, args.seed)
+        timings = {}
+
+        def load():
+            load_items_from_file(Products(), catalog)
+        timings['load_items_from_file'] = best_time(load, args.repeat)
+
+        products = Products()
+        load_items_from_file(products, catalog)
+        compounds = [i for i in products.get_keys()
+                     if products.get_item(i).get_type()]
+
+        def forget_costs():
+            for itemID in products.get_keys():
+                products.invalidate(itemID)
+
+        def price():
+            for itemID in compounds:
+                products.get_item(itemID).get_cost()
+        timings['Compound.get_cost (cold)'] = best_time(price, args.repeat,
+                                                        forget_costs)
+        timings['Compound.get_cost (cached)'] = best_time(price, args.repeat)
+
+        saved = os.path.join(workdir, 'saved.txt')
+        timings['save_items_to_file'] = best_time(
+            lambda: save_items_to_file(products, saved), args.repeat)
+
+        rand = random.Random(args.seed)
+        keys = products.get_keys()
+        sample = [rand.choice(keys) for _ in xrange(args.lookups)]
+
+        def check_depend():
+            for itemID in sample:
+                products.check_depend(itemID)
+        timings['Products.check_depend'] = best_time(check_depend,
+                                                     args.repeat)
+
+        timings['Products.get_keys'] = best_time(products.get_keys,
+                                                 args.repeat)
+
+        dict_items = [DictItem(*info[1:] + (products,))
+                      for info in iter_items(catalog)]
+        memory = {'Item': footprint(products.pdict.itervalues()),
+                  'DictItem': footprint(dict_items)}
+        del dict_items
+
+        items_list = headless_items_list(products)
+        if items_list is not None:
+            timings['Controller.items_list'] = best_time(items_list,
+                                                         args.repeat)
+        return {
+            'python': platform.python_version(),
+            'parameters': {
+                'parts': args.parts,
+                'compounds': args.compounds,
+                'depth': args.depth,
+                'fanout': args.fanout,
+                'sharing': args.sharing,
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'lookups': args.lookups,
+            },
+            'items': products.get_count(),
+            'file_bytes': os.path.getsize(catalog),
+            'seconds': timings,
+            'item_bytes': memory,
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main(argv=None):
+    """Run the benchmarks and write the JSON results.
+
+    main(list<str>) -> int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=10000)
+    parser.add_argument('--compounds', type=int, default=2000)
+    parser.add_argument('--depth', type=int, default=3,
+                        help='levels of compounds above the parts')
+    parser.add_argument('--fanout', type=int, default=4,
+                        help='components per compound')
+    parser.add_argument('--sharing', type=float, default=0.2,
+                        help='chance that a component is a popular item')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per benchmark; the fastest is reported')
+    parser.add_argument('--lookups', type=int, default=10000,
+                        help='random IDs passed to check_depend')
+    parser.add_argument('--output', help='write the results to this file '
+                                         'instead of standard output')
+    args = parser.parse_args(argv)
+    results = run(args)
+    text = json.dumps(results, indent=2, sort_keys=True) + '\n'
+    if args.output:
+        f = open(args.output, 'w')
+        f.write(text)
+        f.close()
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""An array-backed Products store for pricing whole catalogs at once.
+
+ColumnarProducts keeps the same items as Products, but prices them from
+a cost array and a sparse component matrix laid out in topological
+order (see Products.get_levels), so every compound is rolled up in one
+pass.  NumPy is used for the pass when it is installed.
+"""
+
+from itertools import izip
+
+from parts_list import PROFILER, Products, gc_paused
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ColumnarProducts(Products):
+    """A Products dictionary whose costs are rolled up in bulk.
+
+    Any change to the items invalidates the column layout, and any change
+    to a part cost invalidates the rolled-up costs; both are rebuilt the
+    next time a cost is asked for.  Compounds with unknown components
+    raise KeyError when priced.
+    """
+
+    def __init__(self):
+        """Constructor: ColumnarProducts()"""
+        Products.__init__(self)
+        self._clear_columns()
+
+    def _clear_columns(self):
+        """Forget the column layout and the rolled-up costs."""
+        self._rows = None       # itemID -> row number, in sorted ID order
+        self._ids = None        # row number -> itemID
+        self._part_costs = None # row number -> part cost, 0 for compounds
+        self._plan = None       # per-level roll-up steps, leaves first
+        self._broken = None     # row number -> error raised when priced
+        self._rolled = None     # row number -> rolled-up cost
+
+    def add_item(self, itemID, item):
+        """Adds an item and invalidates the column layout."""
+        Products.add_item(self, itemID, item)
+        self._clear_columns()
+
+    def add_items(self, items):
+        """Adds many items and invalidates the column layout."""
+        Products.add_items(self, items)
+        self._clear_columns()
+
+    def remove_item(self, itemID):
+        """Deletes an item and invalidates the column layout."""
+        Products.remove_item(self, itemID)
+        self._clear_columns()
+
+    def delete_all(self):
+        """Empties the dictionary and the columns."""
+        Products.delete_all(self)
+        self._clear_columns()
+
+    def item_changed(self, item, attribute, old):
+        """Updates the columns after an item changes."""
+        Products.item_changed(self, item, attribute, old)
+        if self.get_item_or_none(item.get_ID()) is not item:
+            return
+        if attribute == 'cost' and self._rows is not None:
+            # Only a part cost changed, so the layout is still valid.
+            self._part_costs[self._rows[item.get_ID()]] = item.get_cost()
+            self._rolled = None
+        elif attribute == 'items':
+            self._clear_columns()
+
+    def get_cost(self, itemID):
+        """Returns the rolled-up cost of the item associated with itemID.
+
+        columnar.get_cost(str) -> int
+
+        """
+        rolled = self._roll_up()
+        row = self._rows[itemID]
+        if row in self._broken:
+            raise self._broken[row]
+        return int(rolled[row])
+
+    def get_costs(self):
+        """Returns a dictionary of the rolled-up cost of every item.
+
+        columnar.get_costs() -> dict(str, int)
+
+        """
+        rolled = self._roll_up()
+        if self._broken:
+            raise self._broken.itervalues().next()
+        if numpy is not None:
+            rolled = rolled.tolist()
+        with gc_paused():
+            return dict(izip(self._ids, rolled))
+
+    def _roll_up(self):
+        """Return the rolled-up cost of every row, rebuilding the columns
+        and recomputing the costs if needed."""
+        if self._rolled is not None:
+            return self._rolled
+        if self._rows is None:
+            with gc_paused():
+                self._build_columns()
+        if numpy is not None:
+            costs = numpy.array(self._part_costs, dtype=numpy.int64)
+            for rows, starts, children, nums in self._plan:
+                costs[rows] = numpy.add.reduceat(nums * costs[children],
+                                                 starts)
+        else:
+            costs = list(self._part_costs)
+            for row, items in self._plan:
+                cost = 0
+                for child, num in items:
+                    cost += costs[child] * num
+                costs[row] = cost
+        self._rolled = costs
+        return costs
+
+    def _build_columns(self):
+        """Lay out the items as columns and plan the roll-up, grouping
+        compounds by their level in the component tree."""
+        ids = self.get_keys()
+        rows = dict(izip(ids, xrange(len(ids))))
+        part_costs = [0] * len(ids)
+        items = {}      # compound row -> list of (child row, number)
+        broken = {}
+        for row, itemID in enumerate(ids):
+            item = self.pdict[itemID]
+            if not item.get_type():
+                part_costs[row] = item.get_cost()
+                continue
+            children = []
+            for child, num in item.get_items_list():
+                if child not in rows:
+                    broken[row] = KeyError(child)
+                    break
+                children.append((rows[child], num))
+            items[row] = children
+
+        plan = []
+        for itemIDs in self.get_levels()[1:]:
+            level = []
+            for itemID in itemIDs:
+                row = rows[itemID]
+                for child, _ in items[row]:
+                    if child in broken and row not in broken:
+                        broken[row] = broken[child]
+                if row not in broken and items[row]:
+                    level.append(row)
+            if numpy is None:
+                plan.extend((row, items[row]) for row in level)
+                continue
+            starts, children, nums = [], [], []
+            for row in level:
+                starts.append(len(children))
+                for child, num in items[row]:
+                    children.append(child)
+                    nums.append(num)
+            plan.append((numpy.array(level, dtype=numpy.intp),
+                         numpy.array(starts, dtype=numpy.intp),
+                         numpy.array(children, dtype=numpy.intp),
+                         numpy.array(nums, dtype=numpy.int64)))
+        self._rows = rows
+        self._ids = ids
+        self._part_costs = part_costs
+        self._plan = plan
+        self._broken = broken
+        self._rolled = None
+
+PROFILER.register(ColumnarProducts, 'get_cost')
+PROFILER.register(ColumnarProducts, 'get_costs')
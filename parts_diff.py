@@ -0,0 +1,257 @@
+"""Differences between two versions of a products file.
+
+diff_catalogs streams both files rather than loading them into Products.
+Each item is reduced to a hash of its name, cost and components, and
+the hashes are compared by ID to find the added, removed and changed
+items.  Only then are the compounds above the changed items priced in
+both versions, to report the compounds whose rolled-up cost changed.
+
+Files larger than DIFF_BUCKET_BYTES are first split by a hash of the item
+ID into temporary bucket files, which are compared one pair at a time,
+so memory use does not grow with the number of parts.  The compounds'
+components are kept in memory for pricing.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from collections import namedtuple
+
+from parts_list import PROFILER, LoadError, iter_items, parse_line
+
+# Files are compared in buckets of about this many bytes of either file.
+DIFF_BUCKET_BYTES = 32 * 1024 * 1024
+
+# The result of diff_catalogs: sorted lists of the IDs added, removed and
+# changed, and (ID, old cost, new cost) for each compound in both files
+# whose rolled-up cost changed.
+CatalogDiff = namedtuple('CatalogDiff', 'added removed changed costs')
+
+
+def item_digest(name, cost, items):
+    """Return a hash of an item's name, cost and components.
+
+    item_digest(str, int, list((str, int))) -> int
+    """
+    return hash((name, cost, tuple(items) if items is not None else None))
+
+
+class _Catalog(object):
+    """The compounds of one version of a products file, as found by a
+    first pass over it."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.compounds = {}     # compound ID -> (line number, components)
+        self.parents = {}       # item ID -> IDs of compounds listing it
+
+    def add_compound(self, lineno, itemID, items):
+        self.compounds[itemID] = (lineno, items)
+        for child, _ in items:
+            self.parents.setdefault(child, []).append(itemID)
+
+    def ancestors(self, itemIDs):
+        """Return the compounds containing any of itemIDs."""
+        found = set()
+        stack = list(itemIDs)
+        while stack:
+            for parent in self.parents.get(stack.pop(), ()):
+                if parent not in found:
+                    found.add(parent)
+                    stack.append(parent)
+        return found
+
+    def check_cycles(self):
+        """Raise LoadError at the first compound found to contain itself,
+        which would otherwise leave get_costs looping for ever."""
+        done = set()
+        for compoundID in self.compounds:
+            if compoundID in done:
+                continue
+            # (compound, its components still to visit), root first; the
+            # compounds on the path are in active
+            path = [(compoundID, iter(self.compounds[compoundID][1]))]
+            active = set([compoundID])
+            while path:
+                top, children = path[-1]
+                for child, _ in children:
+                    if child in active:
+                        raise LoadError(self.filename,
+                                        self.compounds[top][0],
+                                        '{0} contains itself'.format(child))
+                    if child in self.compounds and child not in done:
+                        path.append((child, iter(self.compounds[child][1])))
+                        active.add(child)
+                        break
+                else:
+                    path.pop()
+                    active.discard(top)
+                    done.add(top)
+
+    def get_costs(self, compoundIDs):
+        """Return the rolled-up costs of the given compounds, reading the
+        costs of the parts below them in a second pass over the file."""
+        below = set()
+        stack = list(compoundIDs)
+        while stack:
+            itemID = stack.pop()
+            if itemID not in below:
+                below.add(itemID)
+                if itemID in self.compounds:
+                    stack.extend(c for c, _ in self.compounds[itemID][1])
+        # The file was checked by the first pass, so only the lines of the
+        # parts needed are parsed.
+        costs = {}
+        fid = open(self.filename, 'U')
+        try:
+            for line in fid:
+                itemID = line.split(',', 1)[0].strip()
+                if itemID in below and itemID not in self.compounds:
+                    costs[itemID] = parse_line(line)[2]
+        finally:
+            fid.close()
+        for compoundID in compoundIDs:
+            stack = [compoundID]
+            while stack:
+                top = stack[-1]
+                if top in costs:
+                    stack.pop()
+                    continue
+                lineno, items = self.compounds[top]
+                missing = [c for c, _ in items if c not in costs]
+                for child in missing:
+                    if child not in self.compounds:
+                        raise LoadError(self.filename, lineno,
+                                        'unknown item {0!r}'.format(child))
+                if missing:
+                    stack.extend(missing)
+                    continue
+                costs[top] = sum(costs[c] * num for c, num in items)
+                stack.pop()
+        return costs
+
+
+def _digests(catalog, pieces, workdir):
+    """Read a products file, recording its compounds in catalog.  If
+    pieces is 1 return {ID: digest} for the file; otherwise write
+    "ID digest" lines to that many bucket files in workdir, split by ID,
+    and return their names."""
+    filename = catalog.filename
+    if pieces == 1:
+        digests = {}
+    else:
+        names = [os.path.join(workdir, '{0}.{1}'.format(
+            os.path.basename(filename), n)) for n in xrange(pieces)]
+        buckets = [open(name, 'w') for name in names]
+    try:
+        for lineno, itemID, name, cost, items in iter_items(filename):
+            if items is not None:
+                if itemID in catalog.compounds:
+                    raise LoadError(filename, lineno,
+                                    'duplicate item ID {0!r}'.format(itemID))
+                catalog.add_compound(lineno, itemID, items)
+            digest = item_digest(name, cost, items)
+            if pieces == 1:
+                if itemID in digests:
+                    raise LoadError(filename, lineno,
+                                    'duplicate item ID {0!r}'.format(itemID))
+                digests[itemID] = digest
+            else:
+                buckets[hash(itemID) % pieces].write(
+                    '{0} {1} {2}\n'.format(itemID, digest, lineno))
+    finally:
+        if pieces != 1:
+            for bucket in buckets:
+                bucket.close()
+    if pieces == 1:
+        return digests
+    return names
+
+
+def _read_bucket(filename, name):
+    """Return {ID: digest} for one bucket file of a products file."""
+    digests = {}
+    fid = open(name)
+    try:
+        for line in fid:
+            itemID, digest, lineno = line.rsplit(' ', 2)
+            if itemID in digests:
+                raise LoadError(filename, int(lineno),
+                                'duplicate item ID {0!r}'.format(itemID))
+            digests[itemID] = int(digest)
+    finally:
+        fid.close()
+    return digests
+
+
+def _compare(old, new, added, removed, changed):
+    """Add the differences between two {ID: digest} maps to the lists."""
+    for itemID, digest in new.iteritems():
+        was = old.pop(itemID, None)
+        if was is None:
+            added.append(itemID)
+        elif was != digest:
+            changed.append(itemID)
+    removed.extend(old)
+
+
+def diff_catalogs(old_filename, new_filename):
+    """Compare two products files.
+
+    diff_catalogs(str, str) -> CatalogDiff
+
+    Raises LoadError if either file is malformed, repeats an ID or has a
+    compound that contains itself, or if a compound whose cost is needed
+    uses an unknown item.
+    """
+    old = _Catalog(old_filename)
+    new = _Catalog(new_filename)
+    size = max(os.path.getsize(old_filename), os.path.getsize(new_filename))
+    pieces = max(1, -(-size // DIFF_BUCKET_BYTES))
+    added, removed, changed = [], [], []
+    workdir = tempfile.mkdtemp(prefix='parts_diff') if pieces > 1 else None
+    try:
+        old_digests = _digests(old, pieces, workdir)
+        new_digests = _digests(new, pieces, workdir)
+        if pieces == 1:
+            _compare(old_digests, new_digests, added, removed, changed)
+        else:
+            for old_bucket, new_bucket in zip(old_digests, new_digests):
+                _compare(_read_bucket(old_filename, old_bucket),
+                         _read_bucket(new_filename, new_bucket),
+                         added, removed, changed)
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir)
+    old.check_cycles()
+    new.check_cycles()
+    touched = added + removed + changed
+    candidates = sorted(itemID for itemID in
+                        old.ancestors(touched) | new.ancestors(touched) |
+                        set(changed)
+                        if itemID in old.compounds and itemID in new.compounds)
+    costs = []
+    if candidates:
+        old_costs = old.get_costs(candidates)
+        new_costs = new.get_costs(candidates)
+        costs = [(itemID, old_costs[itemID], new_costs[itemID])
+                 for itemID in candidates
+                 if old_costs[itemID] != new_costs[itemID]]
+    return CatalogDiff(sorted(added), sorted(removed), sorted(changed), costs)
+
+
+def write_diff(diff, out):
+    """Write a CatalogDiff as "added ID", "removed ID", "changed ID" and
+    "cost ID, old, new" lines.
+
+    write_diff(CatalogDiff, file) -> None
+    """
+    for label, itemIDs in (('added', diff.added), ('removed', diff.removed),
+                           ('changed', diff.changed)):
+        for itemID in itemIDs:
+            out.write('{0} {1}\n'.format(label, itemID))
+    for itemID, old, new in diff.costs:
+        out.write('cost {0}, {1}, {2}\n'.format(itemID, old, new))
+
+PROFILER.register(sys.modules[__name__], 'diff_catalogs', 'diff_catalogs')
@@ -0,0 +1,167 @@
+"""Undo and redo for the edits made to a Products dictionary.
+
+    history = History(products)
+    products.get_item('WH139').set_cost(9000)
+    history.undo()      # WH139 costs what it did before
+    history.redo()      # and 9000 again
+
+Loading a file does not call listeners, so clear() the history after a
+load.
+"""
+
+from contextlib import contextmanager
+
+# Undo steps kept by default; older steps are forgotten.
+HISTORY_LIMIT = 100
+
+
+class History(object):
+    """The undo and redo stacks of a Products dictionary.
+
+    History follows the dictionary as a listener.  Each change is kept as
+    the (event, item ID, old, new) arguments the listener was called with,
+    which is enough to reverse it, so a step takes the same memory however
+    large the catalog is.  Undoing a step makes the reversing edits through
+    Products, so costs, listeners and journals are updated as for any
+    other edit.  The changes made while undoing become the redo step.
+    """
+
+    def __init__(self, products, limit=HISTORY_LIMIT):
+        """Record the edits made to products from now on, keeping at most
+        limit undo steps.
+
+        Constructor: History(Products, int)
+        """
+        self._products = products
+        self._limit = limit
+        self._undo = []         # steps, each a list of changes, oldest first
+        self._redo = []
+        self._group = None      # changes recorded by the open group()
+        self._depth = 0         # nesting of open group() blocks
+        self._replay = None     # changes made by the undo or redo under way
+        products.add_listener(self.record)
+
+    def close(self):
+        """Stop following edits to the products dictionary.
+
+        history.close() -> None
+
+        """
+        self._products.remove_listener(self.record)
+
+    def clear(self):
+        """Forget every undo and redo step.
+
+        history.clear() -> None
+
+        """
+        self._undo = []
+        self._redo = []
+
+    def can_undo(self):
+        """Returns True if there is a step to undo.
+
+        history.can_undo() -> bool
+
+        """
+        return bool(self._undo)
+
+    def can_redo(self):
+        """Returns True if there is an undone step to redo.
+
+        history.can_redo() -> bool
+
+        """
+        return bool(self._redo)
+
+    def record(self, event, itemID, old, new):
+        """Products listener that records a change.
+
+        history.record(str, str, object, object) -> None
+
+        """
+        change = (event, itemID, old, new)
+        if self._replay is not None:
+            self._replay.append(change)
+        elif self._group is not None:
+            self._group.append(change)
+        else:
+            self._push(self._undo, [change])
+            self._redo = []
+
+    @contextmanager
+    def group(self):
+        """Record the changes made in the block as one step, so that they
+        are undone together.  Groups may be nested.
+
+        with history.group(): ...
+        """
+        if self._depth == 0:
+            self._group = []
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                step, self._group = self._group, None
+                if step:
+                    self._push(self._undo, step)
+                    self._redo = []
+
+    def undo(self):
+        """Reverse the last step.  Returns the changes made, in the order
+        they were made, as (event, item ID, old, new) tuples; nothing if
+        there is nothing to undo.
+
+        history.undo() -> list<(str, str, object, object)>
+
+        """
+        return self._reverse(self._undo, self._redo)
+
+    def redo(self):
+        """Make the last undone step again.  Returns the changes made, as
+        for undo().
+
+        history.redo() -> list<(str, str, object, object)>
+
+        """
+        return self._reverse(self._redo, self._undo)
+
+    def _push(self, stack, step):
+        """Add a step to an undo or redo stack, dropping the oldest steps
+        beyond the limit."""
+        stack.append(step)
+        del stack[:-self._limit]
+
+    def _reverse(self, source, target):
+        """Reverse the last step of source and push the reversing changes
+        onto target."""
+        if not source:
+            return []
+        step = source.pop()
+        self._replay = []
+        try:
+            for change in reversed(step):
+                self._reverse_change(*change)
+        finally:
+            done, self._replay = self._replay, None
+        self._push(target, done)
+        return done
+
+    def _reverse_change(self, event, itemID, old, new):
+        """Make the edit that reverses one change."""
+        products = self._products
+        if event == 'add':
+            if old is None:
+                products.remove_item(itemID)
+            else:
+                products.add_item(itemID, old)
+        elif event == 'remove':
+            products.add_item(itemID, old)
+        elif event == 'name':
+            products.get_item(itemID).set_name(old)
+        elif event == 'cost':
+            products.get_item(itemID).set_cost(old)
+        else:
+            products.get_item(itemID).set_items(old)
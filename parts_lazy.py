@@ -0,0 +1,573 @@
+"""A Products store that parses the lines of a products file on demand.
+
+Loading a LazyProducts only scans the file for the ID at the start of
+each line and remembers where the line is.  An item's line is parsed into
+a Part or Compound the first time the item is asked for, by get_item or
+by the cost roll-up of a compound containing it, so opening a large
+catalog to price a few items costs one scan rather than building every
+item:
+
+    products = LazyProducts()
+    products.load_items('catalog.txt')
+    products.get_cost('bike101')      # parses bike101 and the items in it
+
+Binary snapshots are read the same way: opening one only reads its
+string table and ID array, and each item is built from the mapped arrays
+when it is first asked for.
+
+It has the same methods as Products for finding, pricing and editing
+items.  A line is only checked when it is parsed, so a malformed line or
+an unknown component is reported by the call that reaches it.
+"""
+
+import mmap
+import os
+import re
+import struct
+from bisect import bisect_right
+from itertools import count, izip
+
+from parts_list import (JOURNAL_SUFFIX, PROFILER, BaseProducts, Compound,
+                        CycleError, LoadError, Part, is_snapshot,
+                        map_snapshot, parse_line, replay_journal)
+
+# The ID at the start of a line and the comma after it, or the end of a
+# line with no comma.
+LINE_ID = re.compile(r'^[ \t]*([^,\r\n]*?)[ \t]*(,|\r?$)', re.M)
+
+
+class _Snapshot(object):
+    """The arrays of a mapped snapshot file, read one item at a time."""
+
+    def __init__(self, filename):
+        self._data, self._strings, layout = map_snapshot(filename)
+        (self._costs, self._qtys, ids, self._names, self._counts,
+         self._comp_ids) = layout
+        self.keys = [self._strings[i] for i in self._array(ids)]
+        self._starts = None     # item number -> its first component
+        self._users = None      # component string numbers, once needed
+
+    def close(self):
+        self._data.close()
+
+    def _value(self, array, n):
+        """Return element n of an array."""
+        fmt, _, offset = array
+        return struct.unpack_from('<' + fmt, self._data,
+                                  offset + n * struct.calcsize(fmt))[0]
+
+    def _array(self, array, start=0, size=None):
+        """Return size elements of an array from start, or all of it."""
+        fmt, length, offset = array
+        if size is None:
+            size = length - start
+        return struct.unpack_from('<{0}{1}'.format(size, fmt), self._data,
+                                  offset + start * struct.calcsize(fmt))
+
+    def _first_components(self):
+        """Return the position of each item's first component."""
+        if self._starts is None:
+            starts = []
+            total = 0
+            for size in self._array(self._counts):
+                starts.append(total)
+                if size > 0:
+                    total += size
+            self._starts = starts
+        return self._starts
+
+    def item(self, n, products):
+        """Build item number n."""
+        itemID = self.keys[n]
+        name = self._strings[self._value(self._names, n)]
+        size = self._value(self._counts, n)
+        if size < 0:
+            item = Part(itemID, name, self._value(self._costs, n))
+            item._products = products
+            return item
+        start = self._first_components()[n]
+        children = [self._strings[i] for i in
+                    self._array(self._comp_ids, start, size)]
+        return Compound(itemID, name, products,
+                        zip(children, self._array(self._qtys, start, size)))
+
+    def users(self, itemID):
+        """Return the numbers of the items listing itemID as a component."""
+        try:
+            number = self._strings.index(itemID)
+        except ValueError:
+            return []
+        if self._users is None:
+            self._users = self._array(self._comp_ids)
+        starts = self._first_components()
+        found = []
+        pos = -1
+        while True:
+            try:
+                pos = self._users.index(number, pos + 1)
+            except ValueError:
+                return found
+            found.append(bisect_right(starts, pos) - 1)
+
+
+class LazyProducts(BaseProducts):
+    """A Products dictionary whose items are parsed from a products file
+    when first used."""
+
+    def __init__(self):
+        """Constructor: LazyProducts()"""
+        BaseProducts.__init__(self)
+        self._filename = None
+        self._data = ''         # the mapped file, or its contents
+        self._snapshot = None   # the _Snapshot, if a snapshot is loaded
+        self._offsets = {}      # unparsed item ID -> offset of its line,
+                                # or its item number in a snapshot
+        self._items = {}        # parsed or added item ID -> item
+        self._parents = {}      # item ID -> parsed compounds that list it
+        self._costs = {}        # compound ID -> cached rolled-up cost
+        self._order = None      # sorted item IDs, once asked for
+
+    def close(self):
+        """Unmap the products file.  The items not yet parsed are lost.
+
+        products.close() -> None
+
+        """
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = ''
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+        self._offsets = {}
+
+    def load_items(self, filename, processes=1, progress=None):
+        """Index the items in a products file or binary snapshot, then
+        replay the file's journal if it has one.  Items already in the
+        dictionary are parsed first, as only one file can be indexed at a
+        time.  processes is ignored and progress, if given, is called once
+        as progress(lines, []) after the scan, as no items have been
+        parsed.
+
+        products.load_items(str, int, function) -> None
+
+        Raises LoadError for duplicate IDs and lines without an ID; other
+        errors are found when the lines are parsed.
+
+        """
+        listeners, self._listeners = self._listeners, []
+        try:
+            self._parse_all()
+            self.close()
+            if is_snapshot(filename):
+                self._map_snapshot(filename, progress)
+            else:
+                self._scan(filename, progress)
+            if os.path.exists(filename + JOURNAL_SUFFIX):
+                replay_journal(self, filename + JOURNAL_SUFFIX)
+        finally:
+            self._listeners = listeners
+
+    def _scan(self, filename, progress):
+        """Map a products file and index the offset of each item's line."""
+        fid = open(filename, 'rb')
+        try:
+            try:
+                data = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):   # empty or not mappable
+                data = fid.read()
+        finally:
+            fid.close()
+        self._filename = filename
+        self._data = data
+        offsets = {}
+        for match in LINE_ID.finditer(data):
+            itemID, comma = match.groups()
+            if comma != ',':
+                if itemID:
+                    self._error(match.start(),
+                                'expected an ID, a name and a cost or '
+                                'items list')
+                continue
+            if not itemID:
+                self._error(match.start(), 'missing item ID')
+            if itemID in offsets or itemID in self._items:
+                self._error(match.start(),
+                            'duplicate item ID {0!r}'.format(itemID))
+            offsets[itemID] = match.start()
+        self._offsets = offsets
+        self._changed()
+        if progress is not None:
+            lines = self._lineno(len(data))
+            if data[-1:] == '\n':
+                lines -= 1
+            progress(lines, [])
+
+    def _map_snapshot(self, filename, progress):
+        """Map a snapshot file and index the number of each item."""
+        snapshot = _Snapshot(filename)
+        self._filename = filename
+        self._snapshot = snapshot
+        offsets = dict(izip(snapshot.keys, count()))
+        if len(offsets) < len(snapshot.keys) or self._items:
+            for n, itemID in enumerate(snapshot.keys):
+                if offsets[itemID] != n or itemID in self._items:
+                    raise LoadError(filename, n + 1,
+                                    'duplicate item ID {0!r}'.format(itemID))
+        self._offsets = offsets
+        self._changed()
+        if progress is not None:
+            progress(len(snapshot.keys), [])
+
+    def _lineno(self, offset):
+        """Return the line number of an offset in the products file."""
+        return self._data[:offset].count('\n') + 1
+
+    def _error(self, offset, message):
+        """Raise LoadError for the line at offset."""
+        raise LoadError(self._filename, self._lineno(offset), message)
+
+    def _parse(self, itemID):
+        """Parse the line of an unparsed item, or read it from the
+        snapshot, and keep the item."""
+        offset = self._offsets[itemID]
+        if self._snapshot is not None:
+            item = self._snapshot.item(offset, self)
+        else:
+            end = self._data.find('\n', offset)
+            if end < 0:
+                end = len(self._data)
+            try:
+                info = parse_line(self._data[offset:end])
+            except ValueError, e:
+                self._error(offset, e)
+            item_id, name, cost, items = info
+            if items is None:
+                item = Part(item_id, name, cost)
+                item._products = self
+            else:
+                item = Compound(item_id, name, self, items)
+        if item.get_type():
+            self._link(itemID, item.get_depend())
+        del self._offsets[itemID]
+        self._items[itemID] = item
+        return item
+
+    def _parse_all(self):
+        """Parse every item not yet parsed."""
+        for itemID in list(self._offsets):
+            self._parse(itemID)
+
+    def get_parsed_count(self):
+        """Returns the number of items parsed or added so far.
+
+        products.get_parsed_count() -> int
+
+        """
+        return len(self._items)
+
+    def save_items(self, filename):
+        """Saves the items as Products.save_items does.  Every item is
+        parsed unless only the journal is written.
+
+        products.save_items(str) -> None
+
+        """
+        journal = self._journal
+        if ((journal is None or not journal.is_for(filename))
+                and self._filename is not None
+                and os.path.exists(filename)
+                and os.path.samefile(filename, self._filename)):
+            self._release()
+        BaseProducts.save_items(self, filename)
+
+    def compact_journal(self):
+        """Rewrite the journaled products file with the current items and
+        empty its journal.  Every item is parsed.
+
+        products.compact_journal() -> None
+
+        """
+        if (self._journal is not None and self._filename is not None
+                and self._journal.is_for(self._filename)):
+            self._release()
+        BaseProducts.compact_journal(self)
+
+    def _release(self):
+        """Parse every item and unmap the file, which is about to be
+        rewritten under the map."""
+        self._parse_all()
+        self.close()
+
+    def get_item(self, itemID):
+        """Returns the item with the given ID, parsing it if need be.
+        Raises KeyError if there is no such item.
+
+        products.get_item(str) -> Item
+
+        """
+        item = self._items.get(itemID)
+        if item is None:
+            if itemID not in self._offsets:
+                raise KeyError(itemID)
+            item = self._parse(itemID)
+        return item
+
+    def get_item_or_none(self, itemID):
+        """Returns the item with the given ID, or None if there is none.
+
+        products.get_item_or_none(str) -> Item
+
+        """
+        item = self._items.get(itemID)
+        if item is None and itemID in self._offsets:
+            item = self._parse(itemID)
+        return item
+
+    def has_item(self, itemID):
+        """Returns True if there is an item with the given ID.
+
+        products.has_item(str) -> bool
+
+        """
+        return itemID in self._items or itemID in self._offsets
+
+    def add_item(self, itemID, item):
+        """Adds an item, replacing any item with the same ID.
+
+        products.add_item(str, Item) -> None
+
+        Raises CycleError if a compound would contain itself.
+
+        """
+        if item.get_type():
+            self.check_cycle(itemID, item.get_items_list())
+        old = self.get_item_or_none(itemID)
+        if old is None:
+            self._order = None
+        else:
+            self._unlink(itemID, old.get_depend())
+        self._invalidate(itemID)
+        self._items[itemID] = item
+        item._products = self
+        self._link(itemID, item.get_depend())
+        self._notify('add', itemID, old, item)
+
+    def add_items(self, items):
+        """Adds a list of (item ID, item) pairs.
+
+        products.add_items(list<(str, Item)>) -> None
+
+        Raises CycleError if a compound would contain itself.
+
+        """
+        for itemID, item in items:
+            self.add_item(itemID, item)
+
+    def remove_item(self, itemID):
+        """Deletes an item.  Raises KeyError if there is no such item.
+
+        products.remove_item(str) -> None
+
+        """
+        item = self.get_item(itemID)
+        self._invalidate(itemID)
+        del self._items[itemID]
+        self._unlink(itemID, item.get_depend())
+        self._order = None
+        self._notify('remove', itemID, item, None)
+
+    def delete_all(self):
+        """Deletes every item.
+
+        products.delete_all() -> None
+
+        """
+        self.close()
+        self._filename = None
+        self._items = {}
+        self._parents = {}
+        self._costs = {}
+        self._changed()
+
+    def item_changed(self, item, attribute, old):
+        """Called by an item after its 'name', 'cost' or 'items' attribute
+        is changed from old, so that cached costs stay correct and
+        listeners are told about the change.
+
+        products.item_changed(Item, str, object) -> None
+
+        """
+        itemID = item.get_ID()
+        if self._items.get(itemID) is not item:
+            return
+        if attribute == 'name':
+            new = item.get_name()
+        elif attribute == 'cost':
+            new = item.get_cost()
+            self._invalidate(itemID)
+        else:
+            new = item.get_items_list()
+            self._unlink(itemID, [i[0] for i in old])
+            self._link(itemID, item.get_depend())
+            self._invalidate(itemID)
+        self._notify(attribute, itemID, old, new)
+
+    def check_cycle(self, itemID, items):
+        """Raise CycleError if giving itemID the components in items would
+        make it contain itself.  The items below the components are parsed
+        to find out.
+
+        products.check_cycle(str, list<(str, int)>) -> None
+
+        """
+        stack = [i[0] for i in items]
+        seen = set()
+        while stack:
+            component = stack.pop()
+            if component == itemID:
+                raise CycleError(itemID,
+                                 '{0} would contain itself'.format(itemID))
+            if component not in seen:
+                seen.add(component)
+                item = self.get_item_or_none(component)
+                if item is not None:
+                    stack.extend(item.get_depend())
+
+    def get_cost(self, itemID):
+        """Returns the rolled-up cost of an item, parsing the items in it
+        that have not been parsed yet.  Compound costs are cached until
+        one of their components changes.
+
+        products.get_cost(str) -> int
+
+        Raises KeyError if the item, or any item in it, is unknown and
+        CycleError if a compound contains itself.
+
+        """
+        costs = self._costs
+        try:
+            return costs[itemID]
+        except KeyError:
+            pass
+        item = self.get_item(itemID)
+        if not item.get_type():
+            return item.get_cost()
+        entered = set()     # compounds whose components are being priced
+        stack = [itemID]
+        while stack:
+            top = stack[-1]
+            if top in costs:
+                stack.pop()
+                continue
+            items = self.get_item(top).get_items_list()
+            missing = [c for c, _ in items
+                       if c not in costs and self.get_item(c).get_type()]
+            if missing:
+                if top in entered:
+                    raise CycleError(top, '{0} contains itself'.format(top))
+                entered.add(top)
+                stack.extend(missing)
+                continue
+            cost = 0
+            for child, num in items:
+                if child in costs:
+                    cost += costs[child] * num
+                else:   # part
+                    cost += self._items[child].get_cost() * num
+            costs[top] = cost
+            entered.discard(top)
+            stack.pop()
+        return costs[itemID]
+
+    def get_costs(self):
+        """Returns a dictionary of the rolled-up cost of every item.
+        Every item is parsed.
+
+        products.get_costs() -> dict(str, int)
+
+        """
+        self._parse_all()
+        return dict((itemID, self.get_cost(itemID)) for itemID in self._items)
+
+    def _invalidate(self, itemID):
+        """Forget the cached costs of an item and the compounds above it.
+
+        Only parsed compounds are followed: a compound's cost is only
+        cached once everything in it has been parsed.
+        """
+        costs = self._costs
+        if not costs:
+            return
+        costs.pop(itemID, None)
+        stack = [itemID]
+        while stack:
+            for parent in self._parents.get(stack.pop(), ()):
+                if parent in costs:
+                    del costs[parent]
+                    stack.append(parent)
+
+    def _users(self, itemID):
+        """Return the compounds that list itemID: the parsed ones, and
+        the unparsed ones whose lines mention it, found by searching the
+        file and parsing only the lines it appears in.  In a snapshot the
+        array of component IDs is searched instead."""
+        users = set(self._parents.get(itemID, ()))
+        if self._snapshot is not None:
+            for n in self._snapshot.users(itemID):
+                parentID = self._snapshot.keys[n]
+                if self._offsets.get(parentID) == n:
+                    users.add(parentID)
+            return users
+        data = self._data
+        pos = data.find(itemID)
+        while pos >= 0:
+            start = data.rfind('\n', 0, pos) + 1
+            end = data.find('\n', pos)
+            if end < 0:
+                end = len(data)
+            match = LINE_ID.match(data, start)
+            parentID = match.group(1)
+            if self._offsets.get(parentID) == start:
+                try:
+                    items = parse_line(data[start:end])[3]
+                except ValueError, e:
+                    self._error(start, e)
+                if items and itemID in [c for c, _ in items]:
+                    users.add(parentID)
+            pos = data.find(itemID, end)
+        return users
+
+    def check_depend(self, itemID):
+        """Returns True if any compound lists itemID as a component.
+
+        products.check_depend(str) -> bool
+
+        """
+        return bool(self._users(itemID))
+
+    def get_count(self):
+        """Returns the number of items.
+
+        products.get_count() -> int
+
+        """
+        return len(self._items) + len(self._offsets)
+
+    def _sorted_keys(self):
+        """Return the sorted ID list, sorting it if need be."""
+        if self._order is None:
+            self._order = sorted(self._offsets.keys() + self._items.keys())
+        return self._order
+
+    def _changed(self):
+        """Note that the file's items were indexed or dropped: forget the
+        sorted IDs and costs, and bump the version."""
+        self._order = None
+        self._costs = {}
+        self._version += 1
+
+for _attribute in ['get_cost', 'get_costs', 'get_keys', 'load_items',
+                   'save_items', '_scan', '_parse']:
+    PROFILER.register(LazyProducts, _attribute)
+del _attribute
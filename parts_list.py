@@ -1,35 +1,346 @@
-from Tkinter import *
-import tkMessageBox
-import tkFileDialog
-from tkMessageBox import askokcancel
+"""Parts and compounds, the Products dictionary and products file I/O.
+
+None of this module needs Tk; the window is in parts_list_gui and is only
+imported when main() is run.
+"""
+
+import gc
+import mmap
+import os
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+from bisect import bisect_left, insort
+from timeit import default_timer
 
 # Formatting for use in the __str__ methods
 PART_FORMAT = "{0:10}{1:30}{2:>10}"
 COMPOUND_FORMAT = "{0:10}{1:30}{2:>10}  {3}"
+
+# Below this many out-of-order additions the sorted key index inserts them
+# one at a time, above it they are merged with a single sort.
+INSORT_LIMIT = 16
+
+# Binary snapshot files start with this and are written for filenames
+# ending in SNAPSHOT_EXTENSION.  See save_snapshot for the layout.
+SNAPSHOT_MAGIC = 'PLSNAP\x00\x01'
+SNAPSHOT_EXTENSION = '.plsnap'
+SNAPSHOT_HEADER = struct.Struct('<8sIIII')
+# The struct formats of the arrays after the string table, in file order:
+# costs, component quantities, ID and name string numbers, component
+# counts and component ID string numbers.
+SNAPSHOT_ARRAYS = ('q', 'q', 'I', 'I', 'i', 'I')
+
+# Edits journaled against a products file are appended to the file with
+# this added to its name.
+JOURNAL_SUFFIX = '.journal'
+
+# Parallel loads hand each worker process pieces of about this many bytes.
+PARALLEL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Batch pricing writes its output in blocks of this many lines.
+PRICE_BLOCK_LINES = 4096
+
+# Loads with a progress callback call it after every this many lines.
+PROGRESS_LINES = 5000
     
 
-def load_items_from_file(products, filename):
+class LoadError(ValueError):
+    """Raised when a line of a products file cannot be loaded."""
+
+    def __init__(self, filename, lineno, message):
+        """Constructor: LoadError(str, int, str)"""
+        ValueError.__init__(self, '{0}, line {1}: {2}'.format(filename, lineno,
+                                                            message))
+        self.filename = filename
+        self.lineno = lineno
+
+
+class CycleError(ValueError):
+    """Raised when an edit would make a compound contain itself."""
+
+    def __init__(self, itemID, message):
+        """Constructor: CycleError(str, str)"""
+        ValueError.__init__(self, message)
+        self.itemID = itemID
+
+
+def parse_line(line):
+    """Split a line of a products file into its ID, name, cost and
+    components.  Parts have components of None and compounds have a cost
+    of None.  Returns None for blank lines and raises ValueError for lines
+    that are not in the products file format.
+
+    Compound lines are either "ID, name, components" or, as written by
+    save_items_to_file, "ID, name, cost, components".  Blank fields after
+    the cost, as left by a trailing comma, are ignored.  A blank cost
+    followed by a components field, as in the "ID, name, , components"
+    lines of a journal, is a compound even if it has no components.
+
+    parse_line(str) -> (str, str, int, list((str, int)))
+    """
+    item_info = line.split(',')
+    if len(item_info) < 3:
+        if line.strip():
+            raise ValueError('expected an ID, a name and a cost or items list')
+        return None
+    item_id = item_info[0].strip()
+    if not item_id:
+        raise ValueError('missing item ID')
+    item_name = item_info[1].strip()
+    if ':' in item_info[2]:   # compound
+        items = [i for i in item_info[2:] if i.strip()]
+        return item_id, item_name, None, get_components(items)
+    if not item_info[2].strip() and len(item_info) > 3:   # unpriced compound
+        items = [i for i in item_info[3:] if i.strip()]
+        return item_id, item_name, None, get_components(items)
+    try:
+        cost = int(item_info[2].strip())
+    except ValueError:
+        raise ValueError('invalid cost {0!r}'.format(item_info[2].strip()))
+    items = [i for i in item_info[3:] if i.strip()]
+    if not items:   # part
+        return item_id, item_name, cost, None
+    # compound with its saved cost
+    return item_id, item_name, None, get_components(items)
+
+def iter_items(filename):
+    """Generate the parsed lines of a products file one at a time, as
+    (line number, ID, name, cost, components) tuples.
+
+    Raises LoadError at the first malformed line.
+
+    iter_items(str) -> iter((int, str, str, int, list((str, int))))
+    """
+    fid = open(filename, 'U')
+    try:
+        for lineno, line in enumerate(fid, 1):
+            try:
+                info = parse_line(line)
+            except ValueError, e:
+                raise LoadError(filename, lineno, e)
+            if info is not None:
+                yield (lineno,) + info
+    finally:
+        fid.close()
+
+def load_items_from_file(products, filename, progress=None):
     """Add the items in the supplied file to the products object.
 
-    load_items_from_file(Products, str) -> None
+    The file is read one line at a time and the items are added together
+    once it has all been read, as load_items_parallel does.  Compounds may
+    refer to items defined later in the file; once the whole file is read
+    any component that is still unknown is reported.
+
+    If progress is given it is called as progress(lineno, items) after
+    every PROGRESS_LINES lines, and after the last line, with the items
+    read since it was last called.  The items are not yet in products.
+    An exception raised by progress stops the load.
 
-    Precondition: Assumes the supplied is of the correct format
+    load_items_from_file(Products, str, function) -> None
+
+    Raises LoadError for malformed lines, duplicate IDs, unknown
+    components and compounds that contain themselves.  Nothing is added
+    to products if a line is malformed or an ID is repeated.
+    """
+    loaded = []
+    compounds = {}      # compound ID -> line number
+    seen = set()
+    read = []
+    lineno = 0
+    for lineno, item_id, item_name, item_cost, items in iter_items(filename):
+        if item_id in seen or products.has_item(item_id):
+            raise LoadError(filename, lineno,
+                            'duplicate item ID {0!r}'.format(item_id))
+        seen.add(item_id)
+        if items is None:   # part
+            item = Part(item_id, item_name, item_cost)
+        else:   # compound
+            item = Compound(item_id, item_name, products, items)
+            compounds[item_id] = lineno
+        loaded.append((item_id, item))
+        if progress is not None:
+            if lineno % PROGRESS_LINES == 0:
+                progress(lineno, read)
+                read = []
+            read.append(item)
+    if progress is not None:
+        progress(lineno, read)
+    unresolved = {}     # unknown component ID -> line it was first used on
+    for item_id, item in loaded:
+        if item_id in compounds:
+            for itemid in item.get_depend():
+                if (itemid not in seen and itemid not in unresolved
+                        and not products.has_item(itemid)):
+                    unresolved[itemid] = compounds[item_id]
+    try:
+        products.add_items(loaded)
+    except CycleError, e:
+        raise LoadError(filename, compounds.get(e.itemID, 0), e)
+    check_unresolved(filename, unresolved)
+
+def load_items_parallel(products, filename, processes=None):
+    """Add the items in the supplied file to the products object, parsing
+    pieces of the file in a pool of processes (one per CPU by default).
+
+    load_items_parallel(Products, str, int) -> None
+
+    Raises LoadError as load_items_from_file does.  Nothing is added to
+    products if a line is malformed or an ID is repeated.
+    """
+    import multiprocessing
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    size = os.path.getsize(filename)
+    if processes < 2 or size < PARALLEL_CHUNK_SIZE:
+        load_items_from_file(products, filename)
+        return
+    chunks = split_file(filename, max(processes, size // PARALLEL_CHUNK_SIZE))
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.imap(_parse_chunk, [(filename, start, end)
+                                           for start, end in chunks])
+        loaded = []
+        compounds = []
+        seen = set()
+        first_line = 0
+        for records, lines, error in results:
+            for lineno, item_id, item_name, item_cost, items in records:
+                lineno += first_line
+                if item_id in seen or products.has_item(item_id):
+                    raise LoadError(filename, lineno,
+                                    'duplicate item ID {0!r}'.format(item_id))
+                seen.add(item_id)
+                if items is None:
+                    item = Part(item_id, item_name, item_cost)
+                else:
+                    item = Compound(item_id, item_name, products, items)
+                    compounds.append((lineno, item_id, items))
+                loaded.append((item_id, item))
+            if error is not None:
+                raise LoadError(filename, first_line + error[0], error[1])
+            first_line += lines
+    finally:
+        pool.terminate()
+        pool.join()
+    unresolved = {}
+    for lineno, _, items in compounds:
+        for itemid, _ in items:
+            if (itemid not in seen and itemid not in unresolved
+                    and not products.has_item(itemid)):
+                unresolved[itemid] = lineno
+    try:
+        products.add_items(loaded)
+    except CycleError, e:
+        lineno = min(n for n, item_id, _ in compounds if item_id == e.itemID)
+        raise LoadError(filename, lineno, e)
+    check_unresolved(filename, unresolved)
+
+def split_file(filename, pieces):
+    """Return (start, end) byte offsets dividing the file into about the
+    given number of pieces, each ending at the end of a line.
+
+    split_file(str, int) -> list<(int, int)>
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    fid = open(filename, 'rb')
+    try:
+        for n in xrange(1, pieces):
+            if n * size // pieces <= bounds[-1]:
+                continue
+            fid.seek(n * size // pieces)
+            fid.readline()
+            if fid.tell() >= size:
+                break
+            bounds.append(fid.tell())
+    finally:
+        fid.close()
+    bounds.append(size)
+    return zip(bounds[:-1], bounds[1:])
+
+def _parse_chunk(args):
+    """Parse the lines between two byte offsets of a file in a worker
+    process.  Returns the parsed lines numbered from 1 within the piece,
+    the number of lines in the piece, and the (line number, message) of
+    the first malformed line or None.
+    """
+    filename, start, end = args
+    fid = open(filename, 'rb')
+    try:
+        fid.seek(start)
+        data = fid.read(end - start)
+    finally:
+        fid.close()
+    lines = data.splitlines()
+    records = []
+    for lineno, line in enumerate(lines, 1):
+        try:
+            info = parse_line(line)
+        except ValueError, e:
+            return records, len(lines), (lineno, str(e))
+        if info is not None:
+            records.append((lineno,) + info)
+    return records, len(lines), None
+
+def check_unresolved(filename, unresolved):
+    """Raise LoadError for the earliest use of an unknown component, if
+    there are any.
+
+    check_unresolved(str, dict(str, int)) -> None
+    """
+    if unresolved:
+        itemid = min(unresolved, key=unresolved.get)
+        message = 'unknown item {0!r}'.format(itemid)
+        if len(unresolved) > 1:
+            message += ' (and {0} more)'.format(len(unresolved) - 1)
+        raise LoadError(filename, unresolved[itemid], message)
+
+def import_prices(products, filename):
+    """Set the costs, and optionally the names, of the parts listed in a
+    price file of "ID, cost" or "ID, cost, name" lines.  Every line is
+    checked before any part is changed, so either all of the file is
+    applied or none of it is.  Returns the IDs of the changed parts.
+
+    import_prices(Products, str) -> list<str>
+
+    Raises LoadError for malformed lines, unknown or repeated IDs and IDs
+    of compounds.
     """
+    updates = []
+    seen = set()
     fid = open(filename, 'U')
-    for line in fid:
-        item_info = line.split(',')
-        if len(item_info) > 2:     # ignores blank lines
-            item_id = item_info[0].strip()
-            item_name = item_info[1].strip()
-            if ':' in item_info[2]:   # compound 
-                items = item_info[2:]
-                products.add_item(item_id, 
-                                  Compound(item_id, item_name, products, 
-                                           get_components(items)))
-            else:   # part
-                item_cost = int(item_info[2].strip())
-                products.add_item(item_id, Part(item_id, item_name, item_cost))
-    fid.close()
+    try:
+        for lineno, line in enumerate(fid, 1):
+            fields = [field.strip() for field in line.split(',')]
+            if fields == ['']:
+                continue
+            if len(fields) not in (2, 3):
+                raise LoadError(filename, lineno,
+                                'expected an ID, a cost and optionally a name')
+            itemID = fields[0]
+            item = products.get_item_or_none(itemID)
+            if item is None:
+                raise LoadError(filename, lineno,
+                                'unknown item {0!r}'.format(itemID))
+            if item.get_type():
+                raise LoadError(filename, lineno,
+                                '{0!r} is not a part'.format(itemID))
+            if itemID in seen:
+                raise LoadError(filename, lineno,
+                                'duplicate item ID {0!r}'.format(itemID))
+            seen.add(itemID)
+            try:
+                cost = int(fields[1])
+            except ValueError:
+                raise LoadError(filename, lineno,
+                                'invalid cost {0!r}'.format(fields[1]))
+            name = fields[2] if len(fields) == 3 else None
+            updates.append((itemID, cost, name))
+    finally:
+        fid.close()
+    return products.update_parts(updates)
 
 def get_components(items):
     """Return a list of pairs of IDs and numbers in items.
@@ -39,16 +350,23 @@ def get_components(items):
     components = []
     for item in items:
         item = item.strip()
-        itemid, _, itemnumstr = item.partition(':')
+        itemid, colon, itemnumstr = item.partition(':')
         itemid = itemid.strip()
         itemnumstr = itemnumstr.strip()
-        components.append((itemid, int(itemnumstr)))
+        try:
+            if not colon or not itemid:
+                raise ValueError()
+            components.append((itemid, int(itemnumstr)))
+        except ValueError:
+            raise ValueError('invalid component {0!r}, expected ID:number'
+                             .format(item))
     return components
  
 
 
 def save_items_to_file(products, filename):
-    """Save the items in products to the given file.
+    """Save the items in products to the given file.  Any journal of the
+    file is removed, as its edits were to the file's old contents.
 
     save_items_to_file(Products, str) -> None
     """
@@ -57,6 +375,15 @@ def save_items_to_file(products, filename):
     for key in keys:
         f.write("{0}\n".format(repr(products.get_item(key))))
     f.close()
+    remove_journal(filename)
+
+def remove_journal(filename):
+    """Delete the journal of a products file if it has one.
+
+    remove_journal(str) -> None
+    """
+    if os.path.exists(filename + JOURNAL_SUFFIX):
+        os.remove(filename + JOURNAL_SUFFIX)
 
 def items_string(items_list):
     """Convert a list of Id, number pairs into a string representation.
@@ -69,8 +396,444 @@ def items_string(items_list):
     return ','.join(result)
 
 
+@contextmanager
+def gc_paused():
+    """Suspend the cyclic garbage collector while loading, which otherwise
+    rescans every new item each time a few hundred more are created.
+
+    with gc_paused(): ...
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+class Profiler(object):
+    """Call counts and wall time for the hot paths of the program.
+
+    Hot paths are registered by name with register().  While the profiler
+    is enabled each of them is replaced by a wrapper that times its calls;
+    disabling it puts the originals back, so profiling costs nothing until
+    it is switched on.  PROFILER is the profiler used by this module and
+    by parts_list_gui.
+    """
+
+    def __init__(self):
+        """Constructor: Profiler()"""
+        self._hot_paths = []
+        self._originals = None
+        self._stats = {}
+
+    def register(self, owner, attribute, label=None):
+        """Register the function owner.attribute, where owner is a class
+        or module, to be timed under label (its qualified name by
+        default).
+
+        profiler.register(object, str, str) -> None
+
+        """
+        if label is None:
+            label = '{0}.{1}'.format(owner.__name__, attribute)
+        self._hot_paths.append((owner, attribute, label))
+        if self._originals is not None:
+            self._wrap(owner, attribute, label)
+
+    def is_enabled(self):
+        """Returns True if calls are being counted.
+
+        profiler.is_enabled() -> bool
+
+        """
+        return self._originals is not None
+
+    def enable(self):
+        """Start counting calls to the registered hot paths.
+
+        profiler.enable() -> None
+
+        """
+        if self._originals is None:
+            self._originals = []
+            for owner, attribute, label in self._hot_paths:
+                self._wrap(owner, attribute, label)
+
+    def disable(self):
+        """Stop counting calls, keeping the counts so far.
+
+        profiler.disable() -> None
+
+        """
+        if self._originals is not None:
+            for owner, attribute, original in reversed(self._originals):
+                if original is None:    # inherited
+                    delattr(owner, attribute)
+                else:
+                    setattr(owner, attribute, original)
+            self._originals = None
+
+    def reset(self):
+        """Forget the counts so far.
+
+        profiler.reset() -> None
+
+        """
+        self._stats.clear()
+
+    def get_stats(self):
+        """Returns the number of calls and the total seconds spent in each
+        hot path called since the last reset.
+
+        profiler.get_stats() -> dict(str, (int, float))
+
+        """
+        return dict((label, tuple(entry))
+                    for label, entry in self._stats.iteritems())
+
+    def dump(self, out):
+        """Write the stats as a table, slowest hot path first.
+
+        profiler.dump(file) -> None
+
+        """
+        stats = sorted(self.get_stats().iteritems(),
+                       key=lambda (label, (calls, seconds)): -seconds)
+        out.write('{0:32}{1:>12}{2:>12}{3:>14}\n'.format(
+            'hot path', 'calls', 'seconds', 'usec/call'))
+        for label, (calls, seconds) in stats:
+            out.write('{0:32}{1:>12}{2:>12.3f}{3:>14.1f}\n'.format(
+                label, calls, seconds, 1e6 * seconds / calls))
+
+    def _wrap(self, owner, attribute, label):
+        """Replace owner.attribute with a timed wrapper.  A method a class
+        inherits is wrapped for that class alone."""
+        own = attribute in owner.__dict__
+        for source in getattr(owner, '__mro__', (owner,)):
+            if attribute in source.__dict__:
+                original = source.__dict__[attribute]
+                break
+        stats = self._stats
+
+        def timed(*args, **kwargs):
+            start = default_timer()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = default_timer() - start
+                entry = stats.get(label)
+                if entry is None:
+                    stats[label] = [1, elapsed]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed
+        timed.__name__ = original.__name__
+        timed.__doc__ = original.__doc__
+        setattr(owner, attribute, timed)
+        self._originals.append((owner, attribute, original if own else None))
+
+PROFILER = Profiler()
+
+def save_snapshot(products, filename):
+    """Save the items in products to a binary snapshot file.
+
+    The file holds, after SNAPSHOT_HEADER (magic, string count, item count,
+    component count, string table size):
+      - the string table: every distinct ID and name, separated by NULs
+      - zero padding to a multiple of 8 bytes
+      - int64 part costs, one per item (0 for compounds)
+      - int64 component quantities
+      - uint32 ID and name string numbers, one of each per item
+      - int32 component counts, one per item (-1 for parts)
+      - uint32 component ID string numbers
+    Items are in sorted ID order and all numbers are little-endian, so the
+    arrays can be read in place from a memory map.  Any journal of the
+    file is removed.
+
+    save_snapshot(Products, str) -> None
+    """
+    strings = {}
+    ids, names, costs, counts, comp_ids, comp_qtys = [], [], [], [], [], []
+    for key in products.get_keys():
+        item = products.get_item(key)
+        ids.append(strings.setdefault(key, len(strings)))
+        names.append(strings.setdefault(item.get_name(), len(strings)))
+        if item.get_type():
+            items = item.get_items_list()
+            costs.append(0)
+            counts.append(len(items))
+            for itemid, num in items:
+                comp_ids.append(strings.setdefault(itemid, len(strings)))
+                comp_qtys.append(num)
+        else:
+            costs.append(item.get_cost())
+            counts.append(-1)
+    table = sorted(strings, key=strings.get)
+    blob = '\x00'.join(table)
+    f = open(filename, 'wb')
+    f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(table), len(ids),
+                                 len(comp_ids), len(blob)))
+    f.write(blob)
+    f.write('\x00' * (-(SNAPSHOT_HEADER.size + len(blob)) % 8))
+    for fmt, values in zip(SNAPSHOT_ARRAYS, (costs, comp_qtys, ids, names,
+                                             counts, comp_ids)):
+        f.write(struct.pack('<{0}{1}'.format(len(values), fmt), *values))
+    f.close()
+    remove_journal(filename)
+
+def map_snapshot(filename):
+    """Memory-map a snapshot file and find the arrays in it.  Returns the
+    map, the string table and the struct format, length and offset of
+    each array in the order save_snapshot writes them.  The caller closes
+    the map.
+
+    map_snapshot(str) -> (mmap, list<str>, list<(str, int, int)>)
+
+    Raises LoadError if the file is not a snapshot or is truncated.
+    """
+    fid = open(filename, 'rb')
+    try:
+        if os.fstat(fid.fileno()).st_size < SNAPSHOT_HEADER.size:
+            raise LoadError(filename, 0, 'not a snapshot file')
+        data = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        fid.close()
+    magic, nstrings, nitems, ncomps, blob_size = \
+        SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        data.close()
+        raise LoadError(filename, 0, 'not a snapshot file')
+    offset = SNAPSHOT_HEADER.size
+    strings = data[offset:offset + blob_size].split('\x00')[:nstrings]
+    offset += blob_size + (-(offset + blob_size) % 8)
+    layout = []
+    for fmt, size in zip(SNAPSHOT_ARRAYS, (nitems, ncomps, nitems, nitems,
+                                           nitems, ncomps)):
+        layout.append((fmt, size, offset))
+        offset += struct.calcsize('<{0}{1}'.format(size, fmt))
+    if offset > len(data) or len(strings) < nstrings:
+        data.close()
+        raise LoadError(filename, 0, 'truncated snapshot file')
+    return data, strings, layout
+
+def load_snapshot(products, filename):
+    """Add the items in a binary snapshot file to the products object.
+    This skips parsing but still builds every item; LazyProducts reads
+    the items of a snapshot from its memory map as they are asked for.
+
+    load_snapshot(Products, str) -> None
+
+    Raises LoadError if the file is not a snapshot, repeats an existing
+    ID or refers to unknown items.  The line numbers reported are those
+    the item would have in the equivalent products file.
+    """
+    data, strings, layout = map_snapshot(filename)
+    try:
+        strings = [intern(i) for i in strings]
+        arrays = [struct.unpack_from('<{0}{1}'.format(size, fmt), data, offset)
+                  for fmt, size, offset in layout]
+    finally:
+        data.close()
+    costs, comp_qtys, ids, names, counts, comp_ids = arrays
+    nitems = len(ids)
+    keys = [strings[i] for i in ids]
+    known = set(keys)
+    if len(known) != nitems or products.get_count():
+        seen = set()
+        for n, item_id in enumerate(keys):
+            if item_id in seen or products.has_item(item_id):
+                raise LoadError(filename, n + 1,
+                                'duplicate item ID {0!r}'.format(item_id))
+            seen.add(item_id)
+    loaded = []
+    unresolved = {}
+    pos = 0
+    for n in xrange(nitems):
+        item_id = keys[n]
+        count = counts[n]
+        if count < 0:
+            loaded.append((item_id,
+                           Part(item_id, strings[names[n]], costs[n])))
+            continue
+        items = [(strings[comp_ids[i]], comp_qtys[i])
+                 for i in xrange(pos, pos + count)]
+        pos += count
+        for itemid, _ in items:
+            if (itemid not in known and itemid not in unresolved
+                    and not products.has_item(itemid)):
+                unresolved[itemid] = n + 1
+        loaded.append((item_id, Compound(item_id, strings[names[n]],
+                                         products, items)))
+    try:
+        products.add_items(loaded)
+    except CycleError, e:
+        raise LoadError(filename, keys.index(e.itemID) + 1, e)
+    check_unresolved(filename, unresolved)
+
+def is_snapshot(filename):
+    """Return True if the file starts with the snapshot file marker.
+
+    is_snapshot(str) -> bool
+    """
+    fid = open(filename, 'rb')
+    try:
+        return fid.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    finally:
+        fid.close()
+
+
+class Journal(object):
+    """Records the edits made to a Products dictionary and appends them to
+    the journal of its products file when saved.
+
+    Each journal line is an operation code and its arguments:
+      +, ID, name, cost            add or replace a part
+      +, ID, name, , items         add or replace a compound
+      -, ID                        remove an item
+      N, ID, name                  rename an item
+      C, ID, cost                  set a part's cost
+      I, ID, items                 set a compound's items
+    """
+
+    def __init__(self, products, filename):
+        """Constructor: Journal(Products, str)"""
+        self._products = products
+        self._filename = filename
+        self._pending = []
+        products.add_listener(self.record)
+
+    def is_for(self, filename):
+        """Return True if this journal records edits to filename.
+
+        journal.is_for(str) -> bool
+
+        """
+        return os.path.abspath(filename) == os.path.abspath(self._filename)
+
+    def record(self, event, itemID, old, new):
+        """Products listener that queues an edit for the next flush.
+
+        journal.record(str, str, object, object) -> None
+
+        """
+        if event == 'add':
+            if new.get_type():
+                line = '+, {0}, {1}, , {2}'.format(itemID, new.get_name(),
+                                                    new.get_items_str())
+            else:
+                line = '+, {0}, {1}, {2}'.format(itemID, new.get_name(),
+                                                 new.get_cost())
+        elif event == 'remove':
+            line = '-, {0}'.format(itemID)
+        elif event == 'name':
+            line = 'N, {0}, {1}'.format(itemID, new)
+        elif event == 'cost':
+            line = 'C, {0}, {1}'.format(itemID, new)
+        else:
+            line = 'I, {0}, {1}'.format(itemID, items_string(new))
+        self._pending.append(line)
+
+    def flush(self):
+        """Append the queued edits to the journal file.
+
+        journal.flush() -> None
+
+        """
+        if self._pending:
+            f = open(self._filename + JOURNAL_SUFFIX, 'a')
+            f.write('\n'.join(self._pending) + '\n')
+            f.close()
+            self._pending = []
+
+    def compact(self):
+        """Rewrite the products file with every item and delete the
+        journal file.
+
+        journal.compact() -> None
+
+        """
+        temp = self._filename + '.tmp'
+        save_items_to_file(self._products, temp)
+        if os.path.exists(self._filename):
+            os.remove(self._filename)
+        os.rename(temp, self._filename)
+        remove_journal(self._filename)
+        self._pending = []
+
+    def close(self):
+        """Stop recording edits.
+
+        journal.close() -> None
+
+        """
+        self._products.remove_listener(self.record)
+
+
+def replay_journal(products, filename):
+    """Apply the edits in a journal file to the products object.
+
+    replay_journal(Products, str) -> None
+
+    Raises LoadError for edits that are malformed or do not apply.
+    """
+    fid = open(filename, 'U')
+    try:
+        for lineno, line in enumerate(fid, 1):
+            if not line.strip():
+                continue
+            op, _, rest = line.partition(',')
+            op = op.strip()
+            try:
+                if op == '+':
+                    info = parse_line(rest)
+                    if info is None:
+                        raise ValueError('missing item')
+                    item_id, item_name, item_cost, items = info
+                    if items is None:
+                        item = Part(item_id, item_name, item_cost)
+                    else:
+                        item = Compound(item_id, item_name, products, items)
+                    products.add_item(item_id, item)
+                    continue
+                itemID, _, rest = rest.partition(',')
+                itemID = itemID.strip()
+                if op == '-':
+                    products.remove_item(itemID)
+                elif op == 'N':
+                    products.get_item(itemID).set_name(rest.strip())
+                elif op == 'C':
+                    products.get_item(itemID).set_cost(int(rest.strip()))
+                elif op == 'I':
+                    items = [i for i in rest.split(',') if i.strip()]
+                    products.get_item(itemID).set_items(get_components(items))
+                else:
+                    raise ValueError('unknown edit {0!r}'.format(op))
+            except KeyError, e:
+                raise LoadError(filename, lineno,
+                                'unknown item {0!r}'.format(e.args[0]))
+            except (ValueError, AttributeError), e:
+                raise LoadError(filename, lineno, e)
+    finally:
+        fid.close()
+
+
+def intern_id(itemID):
+    """Returns the shared copy of an item ID, so that an ID listed by many
+    compounds is only stored once.  Unicode IDs are returned unchanged.
+
+    intern_id(str) -> str
+    """
+    if type(itemID) is str:
+        return intern(itemID)
+    return itemID
+
 class Item(object):
     """A representation of a basic Item which only has a name and an ID"""
+
+    # Items have slots rather than a __dict__ each, as catalogs may hold
+    # millions of them.
+    __slots__ = ('_ID', '_name', '_products')
     
     def __init__(self, itemID, name):
         """Initialises an item object with an item ID and name.
@@ -78,8 +841,9 @@ class Item(object):
         Constructor: Item(int, str)
         
         """
-        self._ID = itemID
+        self._ID = intern_id(itemID)
         self._name = name
+        self._products = None
 
     def get_name(self):
         """Returns the name of the item.
@@ -103,7 +867,10 @@ class Item(object):
         item.set_name(str) -> None
         
         """
+        old = self._name
         self._name = name
+        if self._products is not None:
+            self._products.item_changed(self, 'name', old)
 
     def get_depend(self):
         """Returns an empty list for when there are no dependencies.
@@ -115,6 +882,8 @@ class Item(object):
 
 class Part(Item):
     """A representation of a part which is an item that also has a cost."""
+
+    __slots__ = ('_cost',)
     
     def __init__(self, itemID, name, cost):
         """Initialise a part with item name, item ID and cost.
@@ -147,7 +916,10 @@ class Part(Item):
         part.set_cost(int) -> None
 
         """
+        old = self._cost
         self._cost = cost
+        if self._products is not None:
+            self._products.item_changed(self, 'cost', old)
 
     def __repr__(self):
         """The format of the part to be saved to files."""
@@ -163,7 +935,12 @@ class Part(Item):
 
 class Compound(Item):
     """A representation of a compound which contains is an item
-    that may contain multiple parts."""
+    that may contain multiple parts.
+
+    The items list is kept packed as a tuple of interned component IDs
+    and an array of their quantities, rather than a list of pairs."""
+
+    __slots__ = ('_ids', '_qtys')
     
     def __init__(self, itemID, name, products, itemlist):
         """Initialise the compound with an item ID, name, associated
@@ -174,7 +951,12 @@ class Compound(Item):
         """
         Item.__init__(self,itemID, name)
         self._products = products
-        self._itemlist = itemlist
+        self._pack(itemlist)
+
+    def _pack(self, itemlist):
+        """Store itemlist as a tuple of IDs and an array of quantities."""
+        self._ids = tuple([intern_id(i[0]) for i in itemlist])
+        self._qtys = array('l', [i[1] for i in itemlist])
 
     def get_cost(self):
         """Returns the cost of the compound item from the parts making it up.
@@ -182,18 +964,20 @@ class Compound(Item):
         compound.get_cost() -> int
 
         """
+        if self._products.get_item_or_none(self._ID) is self:
+            return self._products.get_cost(self._ID)
         cost = 0
         for i in self.get_items_list():
-            cost += self._products.get_item(i[0]).get_cost() * i[1]
+            cost += self._products.get_cost(i[0]) * i[1]
         return cost
         
     def get_items_list(self):
         """Returns the list of items making up the compound.
 
-        compound.get_items_list() -> list<str>
+        compound.get_items_list() -> list<(str, int)>
         
         """
-        return self._itemlist
+        return zip(self._ids, self._qtys)
 
     def get_items_str(self):
         """Returns a string representation of the items list.
@@ -206,21 +990,24 @@ class Compound(Item):
     def set_items(self, items):
         """Adjust the items making up the compound item.
 
-        compound.set_items() -> 
+        compound.set_items(list<(str, int)>) -> None
+
+        Raises CycleError if the compound would contain itself.
 
         """
-        self._itemlist = items
+        if self._products.get_item_or_none(self._ID) is self:
+            self._products.check_cycle(self._ID, items)
+        old = self.get_items_list()
+        self._pack(items)
+        self._products.item_changed(self, 'items', old)
 
     def get_depend(self):
         """Gets a list of item ID's the compound contains.
 
-        compound.get_depend() -> Bool
+        compound.get_depend() -> list<str>
 
         """
-        result = []
-        for i in self.get_items_list():
-            result.append(i[0])
-        return result
+        return list(self._ids)
 
     def get_type(self):
         """Return a boolean to tell it an item is a compound or a part.
@@ -233,12 +1020,13 @@ class Compound(Item):
 
     def __str__(self):
         """The listbox formatting of a compound."""
-        if self.get_items_list() != []:
-            return COMPOUND_FORMAT.format(self._ID, self._name, self.get_cost(),
-                                      self.get_items_str())
-        elif self.get_items_list() == []:
-            return COMPOUND_FORMAT.format(self._ID, self._name, self.get_cost(),
-                                      'None')
+        if self._ids:
+            return COMPOUND_FORMAT.format(self._ID, self._name,
+                                          self.get_cost(),
+                                          self.get_items_str())
+        else:
+            return COMPOUND_FORMAT.format(self._ID, self._name,
+                                          self.get_cost(), 'None')
 
     def __repr__(self):
         """The format of a compound to be saved to an output file."""
@@ -247,64 +1035,153 @@ class Compound(Item):
                                            self.get_cost(),
                                            self.get_items_str())
     
-class Products(object):
-    """The dictionary containing information about each Part and Compound"""
-    
+class BaseProducts(object):
+    """The methods shared by Products, LazyProducts and SQLiteProducts
+    that do not depend on how the items are kept: listeners, journaling,
+    batches of part updates, where-used searches and lookups by position
+    in sorted ID order.
+
+    Subclasses provide get_item, has_item, _sorted_keys (the sorted item
+    IDs) and _users (the IDs of the compounds listing an item), or
+    override the methods using them.  _link and _unlink keep the parents
+    of each item in a _parents dictionary for subclasses that have one.
+    """
+
     def __init__(self):
-        """Initialises the products dictionary
+        """Constructor: BaseProducts()"""
+        self._listeners = []
+        self._journal = None
+        self._version = 0     # counts changes, see get_version
 
-        Constructor: Products()
+    def save_items(self, filename):
+        """Saves Parts and Compounds to a file from the dictionary.  Files
+        ending in SNAPSHOT_EXTENSION are saved as binary snapshots.  If
+        the file is the one being journaled only the edits made since the
+        last save are written, to its journal.
+
+        products.save_items(str) -> None
         
         """
-        self.pdict = {}
-    
-    def load_items(self, filename):
-        """Loads Parts and Compounds from a file into the dictionary.
+        if self._journal is not None and self._journal.is_for(filename):
+            self._journal.flush()
+        elif filename.endswith(SNAPSHOT_EXTENSION):
+            save_snapshot(self, filename)
+        else:
+            save_items_to_file(self, filename)
+
+    def open_journal(self, filename):
+        """Start journaling edits against the products file filename, so
+        that saving to filename appends the edits to filename's journal
+        rather than rewriting it.  The dictionary should hold filename's
+        items, as loaded by load_items.
+
+        products.open_journal(str) -> None
 
-        products.load_items(str) -> None
-        
         """
-        load_items_from_file(self, filename)
+        self.close_journal()
+        self._journal = Journal(self, filename)
 
-    def save_items(self, filename):
-        """Saves Parts and Compounds to a file from the dictionary.
+    def close_journal(self):
+        """Stop journaling edits.  Edits not yet saved are discarded from
+        the journal.
+
+        products.close_journal() -> None
 
-        products.save_items(str) -> None
-        
         """
-        save_items_to_file(self, filename)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
 
-    def get_item(self, itemID):
-        """Returns the Part or Compound associated with the itemID.
+    def compact_journal(self):
+        """Rewrite the journaled products file with the current items and
+        empty its journal.
 
-        products.get_item(str) -> Item
+        products.compact_journal() -> None
 
         """
-        return self.pdict[itemID]
+        if self._journal is not None:
+            self._journal.compact()
 
-    def add_item(self, itemID, item):
-        """Adds an item to the products dictionary
+    def update_parts(self, updates):
+        """Apply a list of (item ID, cost, name) updates to parts as one
+        change.  A cost or name of None is left as it is.  All of the
+        updates are checked before any is applied.  Returns the IDs of
+        the parts that changed.
 
-        products.add_item(str, Item) -> None
+        products.update_parts(list<(str, int, str)>) -> list<str>
+
+        Raises KeyError for unknown IDs and ValueError if a cost is given
+        for a compound.
 
         """
-        self.pdict[itemID] = item
+        for itemID, cost, name in updates:
+            if cost is not None and self.get_item(itemID).get_type():
+                raise ValueError('{0!r} is not a part'.format(itemID))
+        changed = []
+        for itemID, cost, name in updates:
+            item = self.get_item(itemID)
+            renamed = name is not None and name != item.get_name()
+            repriced = cost is not None and cost != item.get_cost()
+            if renamed:
+                item.set_name(name)
+            if repriced:
+                item.set_cost(cost)
+            if renamed or repriced:
+                changed.append(itemID)
+        return changed
+
+    def get_version(self):
+        """Returns a number that changes whenever the items change, so
+        that anything derived from them can tell when it is out of date.
+
+        products.get_version() -> int
 
-    def remove_item(self, itemID):
-        """Deletes an entry from the products dictionary
+        """
+        return self._version
 
-        products.remove_item(str) -> None
+    def add_listener(self, listener):
+        """Call listener(event, itemID, old, new) after every change to the
+        products dictionary.  event is 'add' or 'remove' (with old and new
+        the items replaced and added) or the attribute changed: 'name',
+        'cost' or 'items'.  Loading a file does not call listeners.
+
+        products.add_listener(function) -> None
 
         """
-        del self.pdict[itemID]
-            
-    def delete_all(self):
-        """Resets the products dictionary to empty.
+        self._listeners.append(listener)
 
-        products.delete_all() -> None
+    def remove_listener(self, listener):
+        """Stop calling a listener added with add_listener.
+
+        products.remove_listener(function) -> None
 
         """
-        self.pdict = {}
+        self._listeners.remove(listener)
+
+    def _notify(self, event, itemID, old, new):
+        """Pass a change on to the listeners."""
+        self._version += 1
+        for listener in self._listeners:
+            listener(event, itemID, old, new)
+
+    def _link(self, itemID, depend):
+        """Record itemID as a parent of each ID in depend."""
+        parents = self._parents
+        for child in depend:
+            found = parents.get(child)
+            if found is None:
+                parents[child] = set((itemID,))
+            else:
+                found.add(itemID)
+
+    def _unlink(self, itemID, depend):
+        """Forget itemID as a parent of each ID in depend."""
+        for child in depend:
+            parents = self._parents.get(child)
+            if parents is not None:
+                parents.discard(itemID)
+                if not parents:
+                    del self._parents[child]
 
     def get_keys(self):
         """Returns a list of item ID's of the Parts and the Compounds in the
@@ -313,388 +1190,707 @@ class Products(object):
         products.get_keys() -> list<str>
 
         """
-        x = self.pdict.keys()
-        x.sort()
-        return x
+        return list(self._sorted_keys())
 
-    def check_depend(self, itemID):
-        """Check to see if a Part is an item used by a Compound
+    def get_key(self, index):
+        """Returns the item ID at position index in sorted ID order.
 
-        products.check_depend(str) -> bool
+        products.get_key(int) -> str
 
         """
-        for i in self.pdict:
-            if itemID in self.pdict[i].get_depend():
-                return True
-        return False
-
-class Controller(object):
-    """The container for all of the grouped widgets and data processing"""
-    
-    def __init__(self, master):
-        """A controller class for handling all commands and passing
-        information to the View class for display.
+        return self._sorted_keys()[index]
 
-        Constructor: Controller(root)
-        
-        """
-        self._master = master
-        menubar = Menu(master)
-        master.config(menu=menubar)
-        filemenu = Menu(menubar)
-        menubar.add_cascade(label="File", menu=filemenu)
-        filemenu.add_command(label="Open Products File", command=self.open_file)
-        filemenu.add_command(label="Save Products File", command=self.save_file)
-        filemenu.add_command(label="Exit", command=self.close)
-        self._listbox = View(master, self)
-        self._listbox.pack(side=TOP, expand=True, pady=10,
-                     ipady=150, ipadx= 450, fill=BOTH)
-        self._inputs = Input(master, self)
-        self._inputs.pack(side=TOP)
-        self._entry = Entbox(master, self)
-        self._entry.pack(side=TOP)
-        self._products = Products()
-
-    def open_file(self):
-        """A method for openning a file selected by the user.
-
-        controller.open_file() -> None
-
-        """
-        self._filename = tkFileDialog.askopenfilename()
-        if self._filename:
-            self._listbox.delete(0, END)
-            self._products.delete_all()
-            self._products.load_items(self._filename)
-            self._listbox.update(self.items_list())
-        
-    def save_file(self):
-        """A method for saving the information to a filename selected
-        by the user.
+    def index_of(self, itemID):
+        """Returns the position of itemID in sorted ID order.
+        Raises ValueError if there is no such item.
 
-        controller.save_file() -> None
+        products.index_of(str) -> int
 
         """
-        self._filename = tkFileDialog.asksaveasfilename()
-        if self._filename:
-            self._products.save_items(self._filename)
+        if not self.has_item(itemID):
+            raise ValueError(itemID)
+        return self.position_of(itemID)
 
-    def get_indexed(self):
-        """Returns the item associated with the listbox index
+    def position_of(self, itemID):
+        """Returns the position itemID has in sorted ID order, or would
+        have if it were added.
 
-        controller.get_indexed() -> Item
+        products.position_of(str) -> int
 
         """
-        index = int(self._listbox.curselection()[0])
-        return self._products.get_item(self._products.get_keys()[index])
+        return bisect_left(self._sorted_keys(), itemID)
 
-    def items_list(self):
-        """Returns a regenerated list of strings for the listbox to display
-        after any change is made to the products dictionary.
+    def where_used(self, itemID, transitive=False):
+        """Returns the IDs of the compounds that list itemID as a component.
+        If transitive is True, compounds that contain it through other
+        compounds are included as well.
 
-        controller.items_list() -> list<str>
+        products.where_used(str, bool) -> list<str>
 
         """
-        result = []
-        for i in self._products.get_keys():
-            result.append(str(self._products.get_item(i)))
-        return result
-        
-    def close(self):
-        """Exit the application.
-
-        controller.close() -> None
+        parents = self._users(itemID)
+        if not transitive:
+            return sorted(parents)
+        found = set(parents)
+        stack = list(parents)
+        while stack:
+            for parent in self._users(stack.pop()):
+                if parent not in found:
+                    found.add(parent)
+                    stack.append(parent)
+        return sorted(found)
+
+    def get_stats(self):
+        """Returns the calls and total seconds of each hot path since the
+        counts were last reset.  Nothing is counted unless PROFILER is
+        enabled.
+
+        products.get_stats() -> dict(str, (int, float))
 
         """
-        ans = askokcancel('Verify exit', 'Really quit?')
-        if ans:
-            self._master.destroy()
+        return PROFILER.get_stats()
 
-    def add_part(self):
-        """The method that is called when the add_part button is pressed.
-        The use can then add a new part ID.
+    def reset_stats(self):
+        """Forget the profiling counts so far.
 
-        controller.add_part() -> None
+        products.reset_stats() -> None
 
         """
-        self._entry.label('Add Part ID')
-        self._entry.button_command(self.add_part_button)
+        PROFILER.reset()
+
+
+class Products(BaseProducts):
+    """The dictionary containing information about each Part and Compound"""
+    
+    def __init__(self):
+        """Initialises the products dictionary
+
+        Constructor: Products()
         
-    def add_part_button(self):
-        """The functionality of the OK button once the Add Part button is
-        pressed and checks to see if an item ID already exists and if it
-        does not it creates a Part and adds it to the Products.
+        """
+        BaseProducts.__init__(self)
+        self.pdict = {}
+        self._costs = {}      # itemID -> cached rolled-up compound cost
+        self._explosions = {} # itemID -> cached leaf parts for one unit
+        self._parents = {}    # itemID -> set of compound IDs that list it
+        self._levels = {}     # itemID -> 0 for parts, 1 + deepest component
+        self._by_level = {}   # level -> set of item IDs at that level
+        self._order = []      # sorted item IDs
+        self._pending = []    # added IDs not yet merged into _order
+    
+    def load_items(self, filename, processes=1, progress=None):
+        """Loads Parts and Compounds from a products file or binary
+        snapshot into the dictionary.  Products files are parsed by the
+        given number of processes, or one per CPU if processes is None.
+        progress is passed on to load_items_from_file when a products file
+        is read by one process, and is otherwise not called.
+        Raises LoadError if the file is malformed.
+
+        products.load_items(str, int, function) -> None
         
-        controller.add_part_button() -> None
-
         """
-        e = self._entry.grab_it()
-        if e not in self._products.get_keys():
-            self._products.add_item(e, Part(e, 'No Name', 0))
-            self._listbox.update(self.items_list())
-        else:
-            tkMessageBox.showwarning('Add Part', 'ID already exists')
+        listeners, self._listeners = self._listeners, []
+        try:
+            with gc_paused():
+                if is_snapshot(filename):
+                    load_snapshot(self, filename)
+                elif processes == 1:
+                    load_items_from_file(self, filename, progress)
+                else:
+                    load_items_parallel(self, filename, processes)
+            if os.path.exists(filename + JOURNAL_SUFFIX):
+                replay_journal(self, filename + JOURNAL_SUFFIX)
+        finally:
+            self._listeners = listeners
 
-    def add_compound(self):
-        """The method that is called when the add_compound button is pressed.
-        The user can then enter a new compound ID.
+    def get_item(self, itemID):
+        """Returns the Part or Compound associated with the itemID.
 
-        controller.add_compound() -> None
+        products.get_item(str) -> Item
 
         """
-        self._entry.label('Add Compound ID')
-        self._entry.button_command(self.add_compound_button)
+        return self.pdict[itemID]
 
-    def add_compound_button(self):
-        """The functionality of the OK button once the Add Compound button is
-        pressed and checks to see if an item ID already exists.
-        
-        controller.add_compound_button() -> None
+    def get_item_or_none(self, itemID):
+        """Returns the item associated with the itemID, or None if there
+        is no such item.
+
+        products.get_item_or_none(str) -> Item
 
         """
-        e = self._entry.grab_it()
-        if e not in self._products.get_keys():
-            self._products.add_item(e, Compound(e, 'No Name',self._products,[]))
-            self._listbox.update(self.items_list())
-        else:
-            tkMessageBox.showwarning('Add Compound', 'ID already exists')
+        return self.pdict.get(itemID)
+
+    def add_item(self, itemID, item):
+        """Adds an item to the products dictionary
 
-    def update_name(self):
-        """The method that is called when the update_name button is pressed.
-        The user can then enter a new name into the entry box to change the
-        name.
+        products.add_item(str, Item) -> None
 
-        controller.add_compound() -> None
+        Raises CycleError if the item would contain itself.
 
         """
-        if self._listbox.curselection():
-            self._entry.label('Update Name')
-            self._entry.button_command(self.updateName_button)
-            self._entry.set_it((self.get_indexed()).get_name())
+        if item.get_type():
+            self.check_cycle(itemID, item.get_items_list())
+        old = self.pdict.get(itemID)
+        if old is not None:
+            self._unlink(itemID, old.get_depend())
+        elif self._pending or (self._order and itemID < self._order[-1]):
+            self._pending.append(itemID)
         else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
+            self._order.append(itemID)
+        self.pdict[itemID] = item
+        item._products = self
+        self._link(itemID, item.get_depend())
+        self._relevel(itemID)
+        self.invalidate(itemID, True)
+        self._notify('add', itemID, old, item)
 
-    def updateName_button(self):
-        """The functionality of the OK button once the Update Name button is
-        pressed. The user can then enter a new name and press OK.
-        
-        controller.add_compound_button() -> None
+    def add_items(self, items):
+        """Adds a list of (item ID, item) pairs with distinct IDs to the
+        products dictionary.  This is faster than calling add_item for
+        each when the dictionary is empty.
+
+        products.add_items(list<(str, Item)>) -> None
+
+        Raises CycleError, and adds nothing if the dictionary was empty,
+        if any compound would contain itself.
 
         """
-        if self._listbox.curselection():
-            name = self._entry.grab_it()
-            self.get_indexed().set_name(name)
-            self._listbox.update(self.items_list())
-        else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
+        if self.pdict:
+            for itemID, item in items:
+                self.add_item(itemID, item)
+            return
+        self.pdict = dict(items)
+        self._pending = list(self.pdict)
+        for itemID, item in self.pdict.iteritems():
+            item._products = self
+            if item.get_type():
+                self._link(itemID, item.get_depend())
+        try:
+            self._level_all()
+        except CycleError:
+            self.delete_all()
+            raise
+        self._version += 1
+        if self._listeners:
+            for itemID, item in self.pdict.iteritems():
+                self._notify('add', itemID, None, item)
 
-    def update_cost(self):
-        """This method changes the functionality of the OK button
-        to allow the user to update the cost by entering a number.
+    def remove_item(self, itemID):
+        """Deletes an entry from the products dictionary
 
-        controller.update_cost() -> None
+        products.remove_item(str) -> None
 
         """
-        if self._listbox.curselection():
-            if not self.get_indexed().get_type():
-                self._entry.label('Update Cost')
-                self._entry.button_command(self.updateCost_button)
-                self._entry.set_it((self.get_indexed()).get_cost())
-            else:
-                tkMessageBox.showwarning('Part Error',
-                                         'This item is not a part')
-        else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
+        item = self.pdict.pop(itemID)
+        del self._sorted_keys()[self.position_of(itemID)]
+        self._unlink(itemID, item.get_depend())
+        self._relevel(itemID)
+        self.invalidate(itemID, True)
+        self._notify('remove', itemID, item, None)
+            
+    def delete_all(self):
+        """Resets the products dictionary to empty.
+
+        products.delete_all() -> None
+
+        """
+        self.pdict = {}
+        self._costs = {}
+        self._explosions = {}
+        self._parents = {}
+        self._levels = {}
+        self._by_level = {}
+        self._order = []
+        self._pending = []
+        self._version += 1
 
-    def updateCost_button(self):
-        """The functionality of the OK button after the Update Cost button is
-        pressed.  Pressing OK will change the cost of the selected item.
+    def get_cost(self, itemID):
+        """Returns the rolled-up cost of the item associated with itemID.
+        Compound costs are cached until one of their components changes.
 
-        controller.updateCost_button() -> None
+        products.get_cost(str) -> int
 
         """
-        if self._listbox.curselection():
-            try:
-                cost = int(self._entry.grab_it())
-            except ValueError:
-                tkMessageBox.showwarning('Value error', 'That is not a number')
-                return
-            self.get_indexed().set_cost(cost)
-            self._listbox.update(self.items_list())
-        else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
+        costs = self._costs
+        try:
+            return costs[itemID]
+        except KeyError:
+            pass
+        item = self.pdict[itemID]
+        if not item.get_type():
+            return item.get_cost()
+        for compoundID in self._uncached(costs, itemID):
+            cost = 0
+            for child, num in self.pdict[compoundID].get_items_list():
+                if child in costs:
+                    cost += costs[child] * num
+                else:   # part
+                    cost += self.pdict[child].get_cost() * num
+            costs[compoundID] = cost
+        return costs[itemID]
+
+    def explode(self, itemID, qty=1):
+        """Returns the number of each part needed to build qty of the item
+        associated with itemID, expanding compounds down to their parts.
+
+        products.explode(str, int) -> dict(str, int)
+
+        """
+        result = {}
+        for partID, num in self._explosion(itemID).iteritems():
+            result[partID] = num * qty
+        return result
 
-    def update_items(self):
-        """This method changes the functionality of the OK button
-        to allow the user to change the items associated with a compound.
+    def explode_many(self, orders):
+        """Returns the total number of each part needed to build every
+        (itemID, qty) pair in orders.  Compounds shared between orders or
+        sub-assemblies are only expanded once.
 
-        controller.update_items() -> None
+        products.explode_many(list<(str, int)>) -> dict(str, int)
 
         """
-        if self._listbox.curselection():
-            if not self.get_indexed().get_type():
-                tkMessageBox.showwarning('Compound Error',
-                                        'This item is not a compound')
-            else:
-                self._entry.label('Update Compound Items')
-                self._entry.button_command(self.updateItems_button)
-                self._entry.set_it((self.get_indexed()).get_items_str())
-        else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
-
-    def updateItems_button(self):
-        """The functionality of the OK button after the Update Items button
-        is pressed.  By entering a string of item ID's and numbers the
-        items list string will be updated.
-
-        controller.updateItems_button() -> None
-
-        """
-        if self._listbox.curselection():
-            selectName = self.get_indexed().get_ID()
-            itemsList = self._entry.grab_it()
-            if selectName not in itemsList:
-                try:
-                    itemsList = get_components(itemsList.split(','))
-                except ValueError:
-                    tkMessageBox.showwarning('Compound item',
-                                             'Invalid items list')
-                    return
-                self.get_indexed().set_items(itemsList)
-                try:
-                    self._listbox.update(self.items_list())
-                except KeyError:
-                    tkMessageBox.showwarning('Compound item',
-                                             'Invalid items list')
-                    return
-            else:
-                tkMessageBox.showwarning("Compound item", "Invalid items list")
-        else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
-        
-    def remove_item(self):
-        """Delete the selected item from the listbox and products dictionary.
+        result = {}
+        for itemID, qty in orders:
+            for partID, num in self._explosion(itemID).iteritems():
+                result[partID] = result.get(partID, 0) + num * qty
+        return result
 
-        controller.remove_item() -> None
+    def _explosion(self, itemID):
+        """Return the cached parts list for one of itemID.  The returned
+        dictionary must not be changed."""
+        explosions = self._explosions
+        try:
+            return explosions[itemID]
+        except KeyError:
+            pass
+        item = self.pdict[itemID]
+        if not item.get_type():
+            return {itemID: 1}
+        for compoundID in self._uncached(explosions, itemID):
+            parts = {}
+            for child, num in self.pdict[compoundID].get_items_list():
+                below = explosions.get(child)
+                if below is None:   # part
+                    parts[child] = parts.get(child, 0) + num
+                    continue
+                for partID, count in below.iteritems():
+                    parts[partID] = parts.get(partID, 0) + count * num
+            explosions[compoundID] = parts
+        return explosions[itemID]
+
+    def _uncached(self, cache, itemID):
+        """Return the compound itemID and the compounds below it that are
+        missing from cache, in topological order (components first).
+        Raises KeyError for unknown components."""
+        found = [itemID]
+        seen = set(found)
+        stack = [itemID]
+        while stack:
+            for child in self.pdict[stack.pop()].get_depend():
+                if child not in cache and child not in seen:
+                    if self.pdict[child].get_type():
+                        seen.add(child)
+                        found.append(child)
+                        stack.append(child)
+        found.sort(key=self._levels.get)
+        return found
+
+    def get_costs(self):
+        """Returns a dictionary of the rolled-up cost of every item.
+
+        products.get_costs() -> dict(str, int)
 
         """
-        if self._listbox.curselection():
-            index = int((self._listbox.curselection()[0]))
-            itemID = self._products.get_keys()[index]
-            if self._products.check_depend(itemID):
-                tkMessageBox.showwarning('Remove Error',
-                            'At least one compound item refers to this item')
-            else:
-                self._products.remove_item(itemID)
-                self._listbox.delete(ANCHOR)
-        else:
-            tkMessageBox.showwarning('Selection error', 'No item selected')
-      
-class View(Listbox):
-    """The listbox container and methods for adjusting it"""
+        costs = {}
+        for level in sorted(self._by_level):
+            for itemID in self._by_level[level]:
+                costs[itemID] = self.get_cost(itemID)
+        return costs
 
-    def __init__(self, master, controller):
-        """Constructor: View(root, controller)"""
-        
-        Listbox.__init__(self, master, font='Courier 10')
-        self._controller = controller
+    def get_topological_order(self):
+        """Returns every item ID ordered so that each compound comes after
+        all of its components: parts first, then compounds by depth.
+
+        products.get_topological_order() -> list<str>
 
-    def update(self, itemslist):
-        """Recreate the listbox when changes are made.
+        """
+        order = []
+        for itemIDs in self.get_levels():
+            order.extend(itemIDs)
+        return order
+
+    def get_levels(self):
+        """Returns the item IDs grouped by level: parts at level 0, then
+        compounds whose deepest component is at level 0, and so on.  Each
+        group is sorted by ID.
 
-        view.update(list<str>) -> None
+        products.get_levels() -> list<list<str>>
 
         """
-        self.delete(0, END)
-        for i in itemslist:
-            self.insert(END, i)
-       
-class Input(Frame):
-    """The container group for the input buttons"""
-    
-    def __init__(self, master, controller):
-        """Constructor: Input(root, controller)"""
-        
-        Frame.__init__(self, master)
-        self._controller = controller
-
-        Button(self, text='Add Part',
-               command=controller.add_part).pack(side=LEFT,padx=10,ipadx=10)
-        Button(self, text='Add Compound',
-               command=controller.add_compound).pack(side=LEFT,padx=10,ipadx=10)
-        Button(self, text='Update Name',
-               command=controller.update_name).pack(side=LEFT,padx=10,ipadx=10)
-        Button(self, text='Update Cost',
-               command=controller.update_cost).pack(side=LEFT,padx=10,ipadx=10)
-        Button(self, text='Update Items',
-               command=controller.update_items).pack(side=LEFT,padx=10,ipadx=10)
-        Button(self, text='Remove Item',
-               command=controller.remove_item).pack(side=LEFT,padx=10,ipadx=10)
-
-class Entbox(Frame):
-    """The container group for the entry box, the displayed label
-    and the OK button"""
-    
-    def __init__(self, master, controller):
-        """Constructor: Entbox(root, controller)"""
-        
-        Frame.__init__(self, master)
-        self._controller = controller
-        self.type = Label(self, text='', width=17)
-        self.type.pack(side=LEFT, ipadx=10, ipady=20)
-        self.v = StringVar()
-        self.entry = Entry(self, bd=2, textvariable=self.v)
-        self.entry.pack(side=LEFT, ipadx=230)
-        self.grab = Button(self, text='OK', command=self.grab_it)
-        self.grab.pack(side=LEFT, padx=10, ipadx=10)
-
-    def grab_it(self):
-        """A method for returning what the user has entered into the entry box.
-
-        entbox.grab_it() -> str
-        
+        levels = []
+        for level in xrange(max(self._by_level) + 1 if self._by_level else 0):
+            levels.append(sorted(self._by_level.get(level, ())))
+        return levels
+
+    def get_level(self, itemID):
+        """Returns the depth of an item: 0 for parts and one more than the
+        deepest component for compounds.
+
+        products.get_level(str) -> int
+
         """
-        a = self.entry.get()
-        self.entry.delete(0, END)
-        return a
+        return self._levels[itemID]
+
+    def check_cycle(self, itemID, items):
+        """Raise CycleError if giving itemID the components in items would
+        make it contain itself.
+
+        products.check_cycle(str, list<(str, int)>) -> None
 
-    def set_it(self, text):
-        """A method to set the entry box text to what already exists in the
-        section the user is attempting to change.
+        """
+        depend = set(i[0] for i in items)
+        if itemID in depend:
+            raise CycleError(itemID,
+                             '{0} cannot contain itself'.format(itemID))
+        seen = set()
+        stack = [itemID]
+        while stack:
+            for parent in self._parents.get(stack.pop(), ()):
+                if parent in depend:
+                    raise CycleError(itemID, '{0} already contains {1}'.format(
+                        parent, itemID))
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+
+    def _relevel(self, itemID):
+        """Recompute the level of itemID and of the compounds above it
+        whose level depends on it."""
+        levels = self._levels
+        stack = [itemID]
+        while stack:
+            x = stack.pop()
+            item = self.pdict.get(x)
+            if item is None:
+                level = None
+            elif item.get_type():
+                level = 1 + max([levels.get(c, 0) for c in item.get_depend()]
+                                or [0])
+            else:
+                level = 0
+            old = levels.get(x)
+            if level == old:
+                continue
+            if old is not None:
+                self._by_level[old].discard(x)
+                if not self._by_level[old]:
+                    del self._by_level[old]
+            if level is None:
+                del levels[x]
+            else:
+                levels[x] = level
+                found = self._by_level.get(level)
+                if found is None:
+                    self._by_level[level] = set((x,))
+                else:
+                    found.add(x)
+            if x in self._parents:
+                stack.extend(self._parents[x])
+
+    def _level_all(self):
+        """Compute the level of every item from scratch, components before
+        the compounds that contain them.  Raises CycleError if there is a
+        cycle."""
+        pdict = self.pdict
+        levels = {}
+        compounds = []
+        for itemID, item in pdict.iteritems():
+            if item.get_type():
+                compounds.append(itemID)
+            else:
+                levels[itemID] = 0
+        # Only compound components hold back a compound's level.
+        waiting = {}
+        ready = []
+        for itemID in compounds:
+            count = len(set(c for c in pdict[itemID].get_depend()
+                            if c in pdict and c not in levels))
+            if count:
+                waiting[itemID] = count
+            else:
+                ready.append(itemID)
+        while ready:
+            itemID = ready.pop()
+            levels[itemID] = 1 + max([levels.get(c, 0) for c in
+                                      pdict[itemID].get_depend()] or [0])
+            for parent in self._parents.get(itemID, ()):
+                waiting[parent] -= 1
+                if not waiting[parent]:
+                    ready.append(parent)
+        if len(levels) < len(pdict):
+            itemID = min(i for i in pdict if i not in levels)
+            raise CycleError(itemID, '{0} contains itself'.format(itemID))
+        by_level = {}
+        for itemID, level in levels.iteritems():
+            by_level.setdefault(level, set()).add(itemID)
+        self._levels = levels
+        self._by_level = by_level
+
+    def invalidate(self, itemID, components=False):
+        """Discard the cached cost of itemID and of every compound that
+        contains it, directly or through other compounds.  If components
+        is True, which items make up itemID has changed and the cached
+        explosions are discarded as well.
+
+        products.invalidate(str, bool) -> None
 
-        entbox.set_it() -> None
+        """
+        self._discard(self._costs, itemID)
+        if components:
+            self._discard(self._explosions, itemID)
+
+    def _discard(self, cache, itemID):
+        """Remove itemID and its cached ancestors from cache."""
+        if not cache:
+            return
+        cache.pop(itemID, None)
+        stack = [itemID]
+        while stack:
+            for parent in self._parents.get(stack.pop(), ()):
+                # A compound is only ever cached after all of its components
+                # are, so an uncached parent has no cached ancestors.
+                if parent in cache:
+                    del cache[parent]
+                    stack.append(parent)
+
+    def item_changed(self, item, attribute, old):
+        """Called by an item after its 'name', 'cost' or 'items' attribute
+        is changed from old, so that cached costs stay correct and
+        listeners are told about the change.
+
+        products.item_changed(Item, str, object) -> None
 
         """
-        self.v.set(text)
+        itemID = item.get_ID()
+        if self.pdict.get(itemID) is not item:
+            return
+        if attribute == 'name':
+            new = item.get_name()
+        elif attribute == 'cost':
+            new = item.get_cost()
+            self.invalidate(itemID)
+        else:
+            new = item.get_items_list()
+            self._unlink(itemID, [i[0] for i in old])
+            self._link(itemID, item.get_depend())
+            self._relevel(itemID)
+            self.invalidate(itemID, True)
+        self._notify(attribute, itemID, old, new)
 
-    def button_command(self, action):
-        """Change the command associated with the OK button as different
-        input buttons are pressed.
+    def has_item(self, itemID):
+        """Returns True if there is an item with the given ID.
 
-        entbox.button_command(function) -> None
+        products.has_item(str) -> bool
 
         """
-        self.grab.config(command=action)
+        return itemID in self.pdict
 
-    def label(self, text):
-        """Change the text on the label to reflect which input button
-        has been pressed by the user.
+    def get_count(self):
+        """Returns the number of items in the products dictionary.
 
-        entbox.label(str) -> None
+        products.get_count() -> int
 
         """
-        self.type.config(text=text)
+        return len(self.pdict)
+
+    def _sorted_keys(self):
+        """Merge any pending additions and return the sorted ID list."""
+        if self._pending:
+            if len(self._pending) < INSORT_LIMIT:
+                for itemID in self._pending:
+                    insort(self._order, itemID)
+            else:
+                self._order.extend(self._pending)
+                self._order.sort()
+            self._pending = []
+        return self._order
 
+    def _users(self, itemID):
+        """Return the IDs of the compounds that list itemID."""
+        return self._parents.get(itemID, ())
 
-class StoreApp():
-    def __init__(self, master=None):
-        master.title("Parts List: Products")
-        self.controller = Controller(master)
+    def check_depend(self, itemID):
+        """Check to see if a Part is an item used by a Compound
+
+        products.check_depend(str) -> bool
 
-def main():
-    root = Tk()
-    app = StoreApp(root)
-    root.mainloop()
+        """
+        return itemID in self._parents
+
+for _owner, _attribute in [(Products, 'get_cost'), (Products, 'get_costs'),
+                           (Products, 'get_keys'), (Products, 'load_items'),
+                           (Products, 'save_items'), (Compound, 'get_cost')]:
+    PROFILER.register(_owner, _attribute)
+for _attribute in ['load_items_from_file', 'load_items_parallel',
+                   'save_items_to_file', 'load_snapshot', 'save_snapshot',
+                   'replay_journal']:
+    PROFILER.register(sys.modules[__name__], _attribute, _attribute)
+del _owner, _attribute
+
+def price_items(products, lines, out, errors=sys.stderr):
+    """Write "ID, name, cost" to out for each line of lines holding an
+    item ID and optionally a quantity ("ID" or "ID, qty"); the cost is
+    the item's rolled-up cost times the quantity.  Problems are reported
+    to errors and the line is skipped.  Returns the number of problems.
+
+    price_items(Products, iter(str), file, file) -> int
+    """
+    block = []
+    failed = 0
+    for lineno, line in enumerate(lines, 1):
+        itemID, _, qty = line.partition(',')
+        itemID = itemID.strip()
+        if not itemID:
+            continue
+        try:
+            qty = int(qty) if qty.strip() else 1
+        except ValueError:
+            errors.write('line {0}: invalid quantity {1!r}\n'.format(
+                lineno, qty.strip()))
+            failed += 1
+            continue
+        try:
+            item = products.get_item(itemID)
+            cost = products.get_cost(itemID) * qty
+        except KeyError, e:
+            errors.write('line {0}: unknown item {1!r}\n'.format(
+                lineno, e.args[0]))
+            failed += 1
+            continue
+        except ValueError, e:   # a catalog line parsed on demand
+            errors.write('line {0}: {1}\n'.format(lineno, e))
+            failed += 1
+            continue
+        block.append('{0}, {1}, {2}\n'.format(itemID, item.get_name(), cost))
+        if len(block) == PRICE_BLOCK_LINES:
+            out.write(''.join(block))
+            block = []
+    out.write(''.join(block))
+    return failed
+
+def dump_stats(filename):
+    """Write the profiling stats to filename, or to standard error if
+    filename is '-'.
+
+    dump_stats(str) -> None
+    """
+    if filename == '-':
+        PROFILER.dump(sys.stderr)
+        return
+    out = open(filename, 'w')
+    try:
+        PROFILER.dump(out)
+    finally:
+        out.close()
+
+def main(argv=None):
+    """Open the Parts List window, or with --price CATALOG, price the item
+    IDs read from a file or standard input without opening a window;
+    --lazy parses only the lines of CATALOG that the prices need.
+    With --serve CATALOG, answer requests for CATALOG's items over HTTP
+    until interrupted; see parts_server.  With --diff OLD NEW, list the
+    differences between two products files and exit with status 1 if
+    there are any.  With --profile FILE the hot paths are timed and their
+    counts written to FILE on exit.  Returns the exit status.
+
+    main(list<str>) -> int
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description='Parts list.')
+    parser.add_argument('--price', metavar='CATALOG',
+                        help='products file or snapshot to price items from')
+    parser.add_argument('ids', nargs='?', default='-',
+                        help='file of "ID" or "ID, qty" lines to price '
+                             '(default: standard input)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='processes used to parse CATALOG '
+                             '(0 for one per CPU)')
+    parser.add_argument('--lazy', action='store_true',
+                        help='only parse the lines of CATALOG needed to '
+                             'price the items')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+                        help='list the items added, removed and changed '
+                             'between two products files and the compounds '
+                             'whose costs changed')
+    parser.add_argument('--serve', metavar='CATALOG',
+                        help='answer item, cost and where-used lookups and '
+                             'price updates for CATALOG over HTTP')
+    parser.add_argument('--port', type=int,
+                        help='port to serve on (default 8765)')
+    parser.add_argument('--threads', type=int,
+                        help='threads answering requests (default 8)')
+    parser.add_argument('--journal', action='store_true',
+                        help="keep served price updates in CATALOG's journal")
+    parser.add_argument('--profile', metavar='FILE',
+                        help='count calls to the hot paths and write the '
+                             'counts to FILE on exit (- for standard error)')
+    args = parser.parse_args(argv)
+    if args.profile:
+        import atexit
+        PROFILER.enable()
+        atexit.register(dump_stats, args.profile)
+    if args.diff:
+        from parts_diff import diff_catalogs, write_diff
+        try:
+            diff = diff_catalogs(*args.diff)
+        except (IOError, LoadError), e:
+            sys.stderr.write('{0}\n'.format(e))
+            return 2
+        write_diff(diff, sys.stdout)
+        return 1 if any(diff) else 0
+    if args.serve:
+        import parts_server
+        products = Products()
+        try:
+            products.load_items(args.serve, args.processes or None)
+        except (IOError, LoadError), e:
+            sys.stderr.write('{0}\n'.format(e))
+            return 2
+        if args.journal:
+            products.open_journal(args.serve)
+        parts_server.serve(products, args.port or parts_server.SERVER_PORT,
+                           args.threads or parts_server.SERVER_THREADS,
+                           args.serve if args.journal else None)
+        return 0
+    if args.price is None:
+        from Tkinter import Tk
+        from parts_list_gui import StoreApp
+        root = Tk()
+        app = StoreApp(root)
+        root.mainloop()
+        return 0
+    if args.lazy:
+        from parts_lazy import LazyProducts
+        products = LazyProducts()
+    else:
+        products = Products()
+    try:
+        products.load_items(args.price, args.processes or None)
+    except (IOError, LoadError), e:
+        sys.stderr.write('{0}\n'.format(e))
+        return 2
+    if args.ids == '-':
+        failed = price_items(products, sys.stdin, sys.stdout)
+    else:
+        fid = open(args.ids, 'U')
+        try:
+            failed = price_items(products, fid, sys.stdout)
+        finally:
+            fid.close()
+    return 1 if failed else 0
     
 if  __name__ == '__main__':
-    main()
+    # Run the importable module's main(), so that parts_list_gui and the
+    # profiler see the same classes as the rest of the program.
+    import parts_list
+    sys.exit(parts_list.main())
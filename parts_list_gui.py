@@ -0,0 +1,1062 @@
+"""The Tkinter window for browsing and editing a products file."""
+
+from bisect import bisect_left
+import Queue
+import threading
+from Tkinter import *
+import tkMessageBox
+import tkFileDialog
+from tkMessageBox import askokcancel
+import tkFont
+
+from parts_list import (COMPOUND_FORMAT, PROFILER, Compound, CycleError,
+                        LoadError, Part, Products, get_components,
+                        import_prices, is_snapshot)
+from parts_history import History
+from parts_search import SearchIndex
+
+# While a file loads in the background the window checks for newly read
+# items this often, in milliseconds.
+LOAD_POLL_MS = 50
+
+
+class LoadCancelled(Exception):
+    """Raised in a Loader's thread to stop the load."""
+
+
+class Loader(object):
+    """Loads a products file in a worker thread.
+
+    The thread reads the file into a new Products dictionary, works out
+    every cost and indexes it for searching, so that none of this holds up
+    the Tk event loop.  Its progress is passed back as messages, which the
+    Tk thread collects with messages():
+      ('rows', fraction, rows)    listbox strings of the items just read
+                                  and the fraction of the file read
+      ('done', products, index)   the loaded Products and its SearchIndex
+      ('failed', message)         the load failed
+    """
+
+    def __init__(self, filename):
+        """Start loading filename.
+
+        Constructor: Loader(str)
+        """
+        self.filename = filename
+        self._messages = Queue.Queue()
+        self._cancelled = threading.Event()
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        """Stop loading.  No more messages are sent.
+
+        loader.cancel() -> None
+
+        """
+        self._cancelled.set()
+
+    def messages(self):
+        """Returns the messages sent since the last call.
+
+        loader.messages() -> list<tuple>
+
+        """
+        result = []
+        try:
+            while True:
+                result.append(self._messages.get_nowait())
+        except Queue.Empty:
+            return result
+
+    def _run(self):
+        """Load the file, in the worker thread."""
+        products = Products()
+        try:
+            total = 1
+            if not is_snapshot(self.filename):
+                total = max(1, count_lines(self.filename))
+
+            def progress(lineno, items):
+                if self._cancelled.is_set():
+                    raise LoadCancelled()
+                rows = [preview_row(item) for item in items]
+                self._messages.put(('rows', float(lineno) / total, rows))
+            products.load_items(self.filename, progress=progress)
+            products.get_costs()
+            index = SearchIndex(products)
+        except LoadCancelled:
+            return
+        except (IOError, LoadError), e:
+            self._messages.put(('failed', str(e)))
+            return
+        except Exception, e:
+            # Anything else, such as a MemoryError, would otherwise end the
+            # thread and leave the window loading for ever.
+            message = type(e).__name__
+            if str(e):
+                message += ': {0}'.format(e)
+            self._messages.put(('failed', message))
+            return
+        if not self._cancelled.is_set():
+            self._messages.put(('done', products, index))
+
+
+def count_lines(filename):
+    """Return the number of lines in a file.
+
+    count_lines(str) -> int
+    """
+    lines = 0
+    fid = open(filename, 'rb')
+    try:
+        for block in iter(lambda: fid.read(1 << 20), ''):
+            lines += block.count('\n')
+    finally:
+        fid.close()
+    return lines
+
+def preview_row(item):
+    """Return the listbox string for an item read before the whole file
+    has loaded.  Compound costs are left out, as their components may not
+    have been read yet.
+
+    preview_row(Item) -> str
+    """
+    if item.get_type():
+        return COMPOUND_FORMAT.format(item.get_ID(), item.get_name(), '',
+                                      item.get_items_str() or 'None')
+    return str(item)
+
+
+class Controller(object):
+    """The container for all of the grouped widgets and data processing"""
+    
+    def __init__(self, master):
+        """A controller class for handling all commands and passing
+        information to the View class for display.
+
+        Constructor: Controller(root)
+        
+        """
+        self._master = master
+        menubar = Menu(master)
+        master.config(menu=menubar)
+        filemenu = Menu(menubar)
+        menubar.add_cascade(label="File", menu=filemenu)
+        filemenu.add_command(label="Open Products File",
+                             command=self.open_file)
+        filemenu.add_command(label="Save Products File",
+                             command=self.save_file)
+        self._journaled = BooleanVar()
+        filemenu.add_checkbutton(label="Journal Saves",
+                                 variable=self._journaled,
+                                 command=self.toggle_journal)
+        filemenu.add_command(label="Compact Products File",
+                             command=self.compact_file)
+        filemenu.add_command(label="Import Prices", command=self.import_prices)
+        filemenu.add_command(label="Exit", command=self.close)
+        editmenu = Menu(menubar)
+        menubar.add_cascade(label="Edit", menu=editmenu)
+        editmenu.add_command(label="Undo", accelerator="Ctrl+Z",
+                             command=self.undo)
+        editmenu.add_command(label="Redo", accelerator="Ctrl+Y",
+                             command=self.redo)
+        master.bind('<Control-z>', lambda e: self.undo())
+        master.bind('<Control-y>', lambda e: self.redo())
+        self._filter = Filter(master, self)
+        self._filter.pack(side=TOP, fill=X)
+        self._listbox = View(master, self)
+        self._listbox.pack(side=TOP, expand=True, pady=10,
+                     ipady=150, ipadx= 450, fill=BOTH)
+        self._inputs = Input(master, self)
+        self._inputs.pack(side=TOP)
+        self._entry = Entbox(master, self)
+        self._entry.pack(side=TOP)
+        self._status = Status(master, self)
+        self._status.pack(side=TOP, fill=X)
+        self._products = Products()
+        self._opened = None
+        self._search = SearchIndex(self._products)
+        self._history = History(self._products)
+        self._matches = None    # sorted IDs matching the filter, or None
+        self._loader = None     # the Loader of the file being opened
+        self._preview = None    # rows read so far while a file loads
+
+    def open_file(self):
+        """A method for openning a file selected by the user.
+
+        controller.open_file() -> None
+
+        """
+        self._filename = tkFileDialog.askopenfilename()
+        if self._filename:
+            self.cancel_load()
+            self._products.close_journal()
+            self._products.delete_all()
+            self._search.rebuild()
+            self._history.clear()
+            self._opened = None
+            self._loader = Loader(self._filename)
+            self._preview = []
+            self._set_editing(False)
+            self._status.loading(True)
+            self._listbox.reset()
+            self._master.after(LOAD_POLL_MS, self._poll_load)
+
+    def cancel_load(self):
+        """Stop loading the file being opened, leaving no items.
+
+        controller.cancel_load() -> None
+
+        """
+        if self._loader is not None:
+            self._loader.cancel()
+            self._finish_load(None, None)
+            self._status.show('Loading cancelled')
+
+    def _poll_load(self):
+        """Show the items read by the loader since the last poll."""
+        if self._loader is None:
+            return
+        grew = False
+        for message in self._loader.messages():
+            if message[0] == 'rows':
+                self._preview.extend(message[2])
+                self._status.show('Loading {0:.0%}'.format(message[1]))
+                grew = True
+            elif message[0] == 'done':
+                self._finish_load(message[1], message[2])
+                return
+            else:
+                self._finish_load(None, None)
+                tkMessageBox.showwarning('Open Products File', message[1])
+                return
+        if grew:
+            self._listbox.rows_appended()
+        self._master.after(LOAD_POLL_MS, self._poll_load)
+
+    def _finish_load(self, products, index):
+        """Switch to the loaded products and index, or to no items if
+        products is None, and allow editing again."""
+        if products is not None:
+            self._search.close()
+            self._history.close()
+            self._products = products
+            self._search = index
+            self._history = History(products)
+            self._opened = self._loader.filename
+            self.toggle_journal()
+        self._loader = None
+        self._preview = None
+        self._set_editing(True)
+        self._status.loading(False)
+        self.set_filter(self._filter.get_text())
+
+    def _set_editing(self, enabled):
+        """Enable or disable the editing buttons."""
+        state = NORMAL if enabled else DISABLED
+        self._inputs.set_state(state)
+        self._entry.set_state(state)
+        
+    def save_file(self):
+        """A method for saving the information to a filename selected
+        by the user.
+
+        controller.save_file() -> None
+
+        """
+        if self._loader is not None:
+            tkMessageBox.showwarning('Save Products File',
+                                     'The products file is still loading')
+            return
+        self._filename = tkFileDialog.asksaveasfilename()
+        if self._filename:
+            self._products.save_items(self._filename)
+
+    def toggle_journal(self):
+        """Start or stop journaling edits to the opened file to match the
+        Journal Saves menu option.
+
+        controller.toggle_journal() -> None
+
+        """
+        if self._journaled.get() and self._opened:
+            self._products.open_journal(self._opened)
+        else:
+            self._products.close_journal()
+
+    def compact_file(self):
+        """Rewrite the journaled file with all of its edits applied.
+
+        controller.compact_file() -> None
+
+        """
+        if self._loader is not None:
+            tkMessageBox.showwarning('Compact Products File',
+                                     'The products file is still loading')
+        elif self._journaled.get() and self._opened:
+            self._products.compact_journal()
+        else:
+            tkMessageBox.showwarning('Compact Products File',
+                                     'Journal Saves is not on')
+
+    def import_prices(self):
+        """Set part costs and names from a price file selected by the
+        user.  Nothing is changed if any line of the file is invalid.
+
+        controller.import_prices() -> None
+
+        """
+        if self._loader is not None:
+            tkMessageBox.showwarning('Import Prices',
+                                     'The products file is still loading')
+            return
+        filename = tkFileDialog.askopenfilename()
+        if filename:
+            try:
+                with self._history.group():
+                    changed = import_prices(self._products, filename)
+            except (IOError, LoadError), e:
+                tkMessageBox.showwarning('Import Prices', str(e))
+                return
+            self._listbox.redraw()
+            self._status.show('{0} parts updated'.format(len(changed)))
+
+    def undo(self):
+        """Undo the last edit.
+
+        controller.undo() -> None
+
+        """
+        if self._loader is None:
+            self.show_changes(self._history.undo())
+
+    def redo(self):
+        """Redo the last undone edit.
+
+        controller.redo() -> None
+
+        """
+        if self._loader is None:
+            self.show_changes(self._history.redo())
+
+    def show_changes(self, changes):
+        """Update the listbox after the given (event, item ID, old, new)
+        changes have been made to the products.  A single item added or
+        removed is inserted or deleted in place, more than one refilters
+        the whole list, and other changes redraw the visible rows.
+
+        controller.show_changes(list<(str, str, object, object)>) -> None
+
+        """
+        moved = [change for change in changes
+                 if change[0] == 'remove' or
+                 (change[0] == 'add' and change[2] is None)]
+        if len(moved) == 1 and len(changes) == 1:
+            if moved[0][0] == 'add':
+                self.item_added(moved[0][1])
+            else:
+                self.item_removed(moved[0][1])
+        elif moved:
+            self.set_filter(self._filter.get_text())
+        elif changes:
+            self._listbox.redraw()
+
+    def get_indexed(self):
+        """Returns the item associated with the listbox index
+
+        controller.get_indexed() -> Item
+
+        """
+        index = int(self._listbox.curselection()[0])
+        return self._products.get_item(self.row_id(index))
+
+    def items_list(self):
+        """Returns the listbox strings for every item in the products
+        dictionary, in sorted ID order.
+
+        controller.items_list() -> list<str>
+
+        """
+        result = []
+        for i in self._products.get_keys():
+            result.append(str(self._products.get_item(i)))
+        return result
+
+    def set_filter(self, text):
+        """Show only the items whose ID or name contains text, or every
+        item if text is empty.
+
+        controller.set_filter(str) -> None
+
+        """
+        if text:
+            self._matches = self._search.search(text)
+        else:
+            self._matches = None
+        self._listbox.reset()
+
+    def row_count(self):
+        """Returns the number of rows the listbox has to display.
+
+        controller.row_count() -> int
+
+        """
+        if self._preview is not None:
+            return len(self._preview)
+        if self._matches is not None:
+            return len(self._matches)
+        return self._products.get_count()
+
+    def row_id(self, index):
+        """Returns the ID of the item shown in the row at index.
+
+        controller.row_id(int) -> str
+
+        """
+        if self._matches is not None:
+            return self._matches[index]
+        return self._products.get_key(index)
+
+    def row_index(self, itemID):
+        """Returns the row showing the item with the given ID, or None if
+        the filter hides it.
+
+        controller.row_index(str) -> int
+
+        """
+        if self._matches is None:
+            return self._products.index_of(itemID)
+        index = bisect_left(self._matches, itemID)
+        if index < len(self._matches) and self._matches[index] == itemID:
+            return index
+        return None
+
+    def row_text(self, index):
+        """Returns the listbox string for the row at index.
+
+        controller.row_text(int) -> str
+
+        """
+        if self._preview is not None:
+            return self._preview[index]
+        return str(self._products.get_item(self.row_id(index)))
+
+    def refresh_items(self, itemIDs, ancestors=False):
+        """Redraw the listbox rows of the given item IDs, and of every
+        compound containing them if ancestors is True.
+
+        controller.refresh_items(list<str>, bool) -> None
+
+        """
+        itemIDs = set(itemIDs)
+        if ancestors:
+            for itemID in list(itemIDs):
+                itemIDs.update(self._products.where_used(itemID, True))
+        rows = [self.row_index(i) for i in itemIDs]
+        self._listbox.refresh([row for row in rows if row is not None])
+
+    def item_removed(self, itemID):
+        """Remove the row of an item that has been removed from the
+        products.
+
+        controller.item_removed(str) -> None
+
+        """
+        if self._matches is None:
+            index = self._products.position_of(itemID)
+        else:
+            index = self.row_index(itemID)
+            if index is None:
+                return
+            del self._matches[index]
+        self._listbox.row_removed(index)
+
+    def item_added(self, itemID):
+        """Show a newly added item, unless the filter hides it.
+
+        controller.item_added(str) -> None
+
+        """
+        if self._matches is not None:
+            self._matches = self._search.search(self._filter.get_text())
+        index = self.row_index(itemID)
+        if index is not None:
+            self._listbox.row_inserted(index)
+            self._listbox.see(index)
+        
+    def get_stats(self):
+        """Returns the calls and total seconds of each hot path, including
+        the listbox formatting and redraws, while profiling is enabled.
+
+        controller.get_stats() -> dict(str, (int, float))
+
+        """
+        return self._products.get_stats()
+
+    def close(self):
+        """Exit the application.
+
+        controller.close() -> None
+
+        """
+        ans = askokcancel('Verify exit', 'Really quit?')
+        if ans:
+            self._master.destroy()
+
+    def add_part(self):
+        """The method that is called when the add_part button is pressed.
+        The use can then add a new part ID.
+
+        controller.add_part() -> None
+
+        """
+        self._entry.label('Add Part ID')
+        self._entry.button_command(self.add_part_button)
+        
+    def add_part_button(self):
+        """The functionality of the OK button once the Add Part button is
+        pressed and checks to see if an item ID already exists and if it
+        does not it creates a Part and adds it to the Products.
+        
+        controller.add_part_button() -> None
+
+        """
+        e = self._entry.grab_it()
+        if not self._products.has_item(e):
+            self._products.add_item(e, Part(e, 'No Name', 0))
+            self.item_added(e)
+        else:
+            tkMessageBox.showwarning('Add Part', 'ID already exists')
+
+    def add_compound(self):
+        """The method that is called when the add_compound button is pressed.
+        The user can then enter a new compound ID.
+
+        controller.add_compound() -> None
+
+        """
+        self._entry.label('Add Compound ID')
+        self._entry.button_command(self.add_compound_button)
+
+    def add_compound_button(self):
+        """The functionality of the OK button once the Add Compound button is
+        pressed and checks to see if an item ID already exists.
+        
+        controller.add_compound_button() -> None
+
+        """
+        e = self._entry.grab_it()
+        if not self._products.has_item(e):
+            self._products.add_item(e, Compound(e, 'No Name',
+                                                self._products, []))
+            self.item_added(e)
+        else:
+            tkMessageBox.showwarning('Add Compound', 'ID already exists')
+
+    def update_name(self):
+        """The method that is called when the update_name button is pressed.
+        The user can then enter a new name into the entry box to change the
+        name.
+
+        controller.add_compound() -> None
+
+        """
+        if self._listbox.curselection():
+            self._entry.label('Update Name')
+            self._entry.button_command(self.updateName_button)
+            self._entry.set_it((self.get_indexed()).get_name())
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+
+    def updateName_button(self):
+        """The functionality of the OK button once the Update Name button is
+        pressed. The user can then enter a new name and press OK.
+        
+        controller.add_compound_button() -> None
+
+        """
+        if self._listbox.curselection():
+            name = self._entry.grab_it()
+            item = self.get_indexed()
+            item.set_name(name)
+            self.refresh_items([item.get_ID()])
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+
+    def update_cost(self):
+        """This method changes the functionality of the OK button
+        to allow the user to update the cost by entering a number.
+
+        controller.update_cost() -> None
+
+        """
+        if self._listbox.curselection():
+            if not self.get_indexed().get_type():
+                self._entry.label('Update Cost')
+                self._entry.button_command(self.updateCost_button)
+                self._entry.set_it((self.get_indexed()).get_cost())
+            else:
+                tkMessageBox.showwarning('Part Error',
+                                         'This item is not a part')
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+
+    def updateCost_button(self):
+        """The functionality of the OK button after the Update Cost button is
+        pressed.  Pressing OK will change the cost of the selected item.
+
+        controller.updateCost_button() -> None
+
+        """
+        if self._listbox.curselection():
+            try:
+                cost = int(self._entry.grab_it())
+            except ValueError:
+                tkMessageBox.showwarning('Value error', 'That is not a number')
+                return
+            item = self.get_indexed()
+            item.set_cost(cost)
+            self.refresh_items([item.get_ID()], True)
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+
+    def update_items(self):
+        """This method changes the functionality of the OK button
+        to allow the user to change the items associated with a compound.
+
+        controller.update_items() -> None
+
+        """
+        if self._listbox.curselection():
+            if not self.get_indexed().get_type():
+                tkMessageBox.showwarning('Compound Error',
+                                        'This item is not a compound')
+            else:
+                self._entry.label('Update Compound Items')
+                self._entry.button_command(self.updateItems_button)
+                self._entry.set_it((self.get_indexed()).get_items_str())
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+
+    def updateItems_button(self):
+        """The functionality of the OK button after the Update Items button
+        is pressed.  By entering a string of item ID's and numbers the
+        items list string will be updated.
+
+        controller.updateItems_button() -> None
+
+        """
+        if self._listbox.curselection():
+            selectName = self.get_indexed().get_ID()
+            itemsList = self._entry.grab_it()
+            try:
+                itemsList = get_components(itemsList.split(','))
+            except ValueError:
+                tkMessageBox.showwarning('Compound item',
+                                         'Invalid items list')
+                return
+            for itemID, _ in itemsList:
+                if not self._products.has_item(itemID):
+                    tkMessageBox.showwarning('Compound item',
+                                             'Invalid items list')
+                    return
+            try:
+                self.get_indexed().set_items(itemsList)
+            except CycleError, e:
+                tkMessageBox.showwarning('Compound item', str(e))
+                return
+            self.refresh_items([selectName], True)
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+        
+    def remove_item(self):
+        """Delete the selected item from the listbox and products dictionary.
+
+        controller.remove_item() -> None
+
+        """
+        if self._listbox.curselection():
+            index = int((self._listbox.curselection()[0]))
+            itemID = self.row_id(index)
+            if self._products.check_depend(itemID):
+                tkMessageBox.showwarning('Remove Error',
+                            'At least one compound item refers to this item')
+            else:
+                self._products.remove_item(itemID)
+                self.item_removed(itemID)
+        else:
+            tkMessageBox.showwarning('Selection error', 'No item selected')
+      
+class View(Frame):
+    """The listbox container and methods for adjusting it.
+
+    Only the rows that fit in the window are formatted and inserted into
+    the listbox; the row text is fetched from the controller as the user
+    scrolls.  Row numbers passed to and returned from a View are
+    positions in the whole products list, not in the visible window.
+    """
+
+    def __init__(self, master, controller):
+        """Constructor: View(root, controller)"""
+        
+        Frame.__init__(self, master)
+        self._controller = controller
+        self._count = 0         # total number of rows
+        self._offset = 0        # row shown at the top of the listbox
+        self._visible = 1       # number of rows that fit in the listbox
+        self._selected = None   # selected row, or None
+        self._box = Listbox(self, font='Courier 10', exportselection=False)
+        self._scroll = Scrollbar(self, command=self._yview)
+        self._scroll.pack(side=RIGHT, fill=Y)
+        self._box.pack(side=LEFT, expand=True, fill=BOTH)
+        self._linespace = tkFont.Font(font=self._box['font']).metrics(
+            'linespace')
+        self._box.bind('<Configure>', self._resized)
+        self._box.bind('<<ListboxSelect>>', self._selection_changed)
+        self._box.bind('<MouseWheel>', self._wheel)
+        self._box.bind('<Button-4>', lambda e: self._scroll_by(-3))
+        self._box.bind('<Button-5>', lambda e: self._scroll_by(3))
+        self._box.bind('<Up>', lambda e: self._move_selection(-1))
+        self._box.bind('<Down>', lambda e: self._move_selection(1))
+
+    def curselection(self):
+        """Returns a tuple containing the selected row, or an empty tuple
+        if no row is selected.
+
+        view.curselection() -> tuple<int>
+
+        """
+        if self._selected is None:
+            return ()
+        return (self._selected,)
+
+    def reset(self):
+        """Show the controller's rows from the top with nothing selected.
+
+        view.reset() -> None
+
+        """
+        self._count = self._controller.row_count()
+        self._offset = 0
+        self._selected = None
+        self._render()
+
+    def refresh(self, rows):
+        """Redraw the given rows if they are currently visible.
+
+        view.refresh(list<int>) -> None
+
+        """
+        for row in rows:
+            local = row - self._offset
+            if 0 <= local < self._visible and row < self._count:
+                self._box.delete(local)
+                self._box.insert(local, self._controller.row_text(row))
+                if row == self._selected:
+                    self._box.selection_set(local)
+
+    def row_inserted(self, row):
+        """Account for a new row at the given position.
+
+        view.row_inserted(int) -> None
+
+        """
+        self._count += 1
+        if self._selected is not None and self._selected >= row:
+            self._selected += 1
+        self._rows_shifted(row, 1)
+
+    def redraw(self):
+        """Redraw every visible row.
+
+        view.redraw() -> None
+
+        """
+        self._render()
+
+    def rows_appended(self):
+        """Account for rows added after the last row.
+
+        view.rows_appended() -> None
+
+        """
+        shown = self._count
+        self._count = self._controller.row_count()
+        if shown < self._offset + self._visible:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def row_removed(self, row):
+        """Account for the row at the given position being removed.
+
+        view.row_removed(int) -> None
+
+        """
+        self._count -= 1
+        if self._selected == row:
+            self._selected = None
+        elif self._selected is not None and self._selected > row:
+            self._selected -= 1
+        self._rows_shifted(row, -1)
+
+    def see(self, row):
+        """Scroll the listbox so that the given row is visible.
+
+        view.see(int) -> None
+
+        """
+        if row < self._offset:
+            self._scroll_to(row)
+        elif row >= self._offset + self._visible:
+            self._scroll_to(row - self._visible + 1)
+
+    def _rows_shifted(self, row, delta):
+        """Redraw after the rows from row onwards have moved by delta."""
+        if row < self._offset:
+            self._offset += delta
+        if row < self._offset + self._visible:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def _render(self):
+        """Fill the listbox with the rows in the visible window."""
+        self._offset = max(0, min(self._offset, self._count - self._visible))
+        self._box.delete(0, END)
+        end = min(self._offset + self._visible, self._count)
+        for row in xrange(self._offset, end):
+            self._box.insert(END, self._controller.row_text(row))
+        if self._selected is not None and self._offset <= self._selected < end:
+            self._box.selection_set(self._selected - self._offset)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        """Move the scrollbar slider to match the visible window."""
+        if self._count:
+            self._scroll.set(float(self._offset) / self._count,
+                             float(self._offset + self._visible) / self._count)
+        else:
+            self._scroll.set(0.0, 1.0)
+
+    def _scroll_to(self, offset):
+        """Show the window starting at the given row."""
+        offset = max(0, min(offset, self._count - self._visible))
+        if offset != self._offset:
+            self._offset = offset
+            self._render()
+
+    def _scroll_by(self, rows):
+        """Scroll the window by the given number of rows."""
+        self._scroll_to(self._offset + rows)
+
+    def _yview(self, *args):
+        """Scrollbar callback, following the Listbox.yview protocol."""
+        if args[0] == 'moveto':
+            self._scroll_to(int(float(args[1]) * self._count))
+        elif args[0] == 'scroll':
+            step = self._visible if args[2] == 'pages' else 1
+            self._scroll_by(int(args[1]) * step)
+
+    def _wheel(self, event):
+        """Scroll on mouse wheel movement."""
+        self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _move_selection(self, step):
+        """Move the selection up or down a row, scrolling if needed."""
+        if self._count == 0:
+            return 'break'
+        if self._selected is None:
+            row = self._offset
+        else:
+            row = max(0, min(self._selected + step, self._count - 1))
+        self._selected = row
+        self.see(row)
+        self._box.selection_clear(0, END)
+        self._box.selection_set(row - self._offset)
+        return 'break'
+
+    def _selection_changed(self, event):
+        """Record the row the user clicked on."""
+        local = self._box.curselection()
+        if local:
+            self._selected = self._offset + int(local[0])
+
+    def _resized(self, event):
+        """Recompute how many rows fit after the listbox is resized."""
+        visible = max(1, event.height // self._linespace)
+        if visible != self._visible:
+            self._visible = visible
+            self._render()
+
+class Filter(Frame):
+    """The filter box above the listbox.  The listbox is filtered as the
+    user types."""
+
+    def __init__(self, master, controller):
+        """Constructor: Filter(root, controller)"""
+
+        Frame.__init__(self, master)
+        self._controller = controller
+        Label(self, text='Filter').pack(side=LEFT, padx=10)
+        self._text = StringVar()
+        self._text.trace('w', self._changed)
+        Entry(self, textvariable=self._text).pack(side=LEFT, expand=True,
+                                                  fill=X, padx=10)
+        Button(self, text='Clear',
+               command=lambda: self._text.set('')).pack(side=LEFT, padx=10)
+
+    def get_text(self):
+        """Returns the text in the filter box.
+
+        filter.get_text() -> str
+
+        """
+        return self._text.get()
+
+    def _changed(self, *args):
+        """Refilter the listbox after the filter text is edited."""
+        self._controller.set_filter(self._text.get())
+
+class Status(Frame):
+    """The status line below the listbox, showing the progress of a file
+    being loaded and a button to cancel it."""
+
+    def __init__(self, master, controller):
+        """Constructor: Status(root, controller)"""
+
+        Frame.__init__(self, master)
+        self._label = Label(self, text='', anchor=W)
+        self._label.pack(side=LEFT, expand=True, fill=X, padx=10)
+        self._cancel = Button(self, text='Cancel', state=DISABLED,
+                              command=controller.cancel_load)
+        self._cancel.pack(side=LEFT, padx=10)
+
+    def show(self, text):
+        """Show text on the status line.
+
+        status.show(str) -> None
+
+        """
+        self._label.config(text=text)
+
+    def loading(self, loading):
+        """Enable the Cancel button while a file loads, and clear the
+        status line once it has.
+
+        status.loading(bool) -> None
+
+        """
+        if loading:
+            self.show('Loading')
+            self._cancel.config(state=NORMAL)
+        else:
+            self.show('')
+            self._cancel.config(state=DISABLED)
+
+class Input(Frame):
+    """The container group for the input buttons"""
+    
+    def __init__(self, master, controller):
+        """Constructor: Input(root, controller)"""
+        
+        Frame.__init__(self, master)
+        self._controller = controller
+        self._buttons = []
+        for text, command in [('Add Part', controller.add_part),
+                              ('Add Compound', controller.add_compound),
+                              ('Update Name', controller.update_name),
+                              ('Update Cost', controller.update_cost),
+                              ('Update Items', controller.update_items),
+                              ('Remove Item', controller.remove_item)]:
+            button = Button(self, text=text, command=command)
+            button.pack(side=LEFT,padx=10,ipadx=10)
+            self._buttons.append(button)
+
+    def set_state(self, state):
+        """Enable (NORMAL) or disable (DISABLED) the input buttons.
+
+        input.set_state(str) -> None
+
+        """
+        for button in self._buttons:
+            button.config(state=state)
+
+class Entbox(Frame):
+    """The container group for the entry box, the displayed label
+    and the OK button"""
+    
+    def __init__(self, master, controller):
+        """Constructor: Entbox(root, controller)"""
+        
+        Frame.__init__(self, master)
+        self._controller = controller
+        self.type = Label(self, text='', width=17)
+        self.type.pack(side=LEFT, ipadx=10, ipady=20)
+        self.v = StringVar()
+        self.entry = Entry(self, bd=2, textvariable=self.v)
+        self.entry.pack(side=LEFT, ipadx=230)
+        self.grab = Button(self, text='OK', command=self.grab_it)
+        self.grab.pack(side=LEFT, padx=10, ipadx=10)
+
+    def grab_it(self):
+        """A method for returning what the user has entered into the entry box.
+
+        entbox.grab_it() -> str
+        
+        """
+        a = self.entry.get()
+        self.entry.delete(0, END)
+        return a
+
+    def set_it(self, text):
+        """A method to set the entry box text to what already exists in the
+        section the user is attempting to change.
+
+        entbox.set_it() -> None
+
+        """
+        self.v.set(text)
+
+    def set_state(self, state):
+        """Enable (NORMAL) or disable (DISABLED) the OK button.
+
+        entbox.set_state(str) -> None
+
+        """
+        self.grab.config(state=state)
+
+    def button_command(self, action):
+        """Change the command associated with the OK button as different
+        input buttons are pressed.
+
+        entbox.button_command(function) -> None
+
+        """
+        self.grab.config(command=action)
+
+    def label(self, text):
+        """Change the text on the label to reflect which input button
+        has been pressed by the user.
+
+        entbox.label(str) -> None
+
+        """
+        self.type.config(text=text)
+
+
+class StoreApp():
+    def __init__(self, master=None):
+        master.title("Parts List: Products")
+        self.controller = Controller(master)
+
+for _owner, _attribute in [(Controller, 'items_list'),
+                           (Controller, 'row_text'),
+                           (Controller, 'refresh_items'),
+                           (Controller, 'set_filter'), (View, 'refresh'),
+                           (View, '_render')]:
+    PROFILER.register(_owner, _attribute)
+del _owner, _attribute
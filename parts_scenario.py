@@ -0,0 +1,203 @@
+"""What-if pricing scenarios layered over a Products dictionary.
+
+A Scenario records only the part costs and compound items it overrides
+and takes everything else from its base Products, so many scenarios can
+be kept open against one large catalog and priced side by side:
+
+    dearer = Scenario(products)
+    dearer.set_cost('FR101', products.get_cost('FR101') * 11 // 10)
+    products.get_cost('bike101'), dearer.get_cost('bike101')
+"""
+
+from parts_list import PROFILER, CycleError
+
+
+class Scenario(object):
+    """A copy-on-write overlay of part costs and compound items.
+
+    Items whose cost cannot differ from the base, because no override is
+    below them, are priced by the base and share its cached costs.  Only
+    the overridden items and the compounds above them are priced by the
+    scenario.  Those costs are cached until the scenario or its base
+    changes; the base is checked with Products.get_version.
+    """
+
+    def __init__(self, base):
+        """Constructor: Scenario(Products)"""
+        self._base = base
+        self._part_costs = {}   # part ID -> overriding cost
+        self._items = {}        # compound ID -> overriding items list
+        self._forget()
+
+    def _forget(self):
+        """Drop the cached costs and the set of items they depend on."""
+        self._version = None    # base version the caches were built for
+        self._affected = None   # IDs whose cost may differ from the base
+        self._costs = {}        # affected ID -> cost in this scenario
+
+    def get_base(self):
+        """Returns the Products the scenario overlays.
+
+        scenario.get_base() -> Products
+
+        """
+        return self._base
+
+    def set_cost(self, itemID, cost):
+        """Override the cost of a part.
+
+        scenario.set_cost(str, int) -> None
+
+        Raises KeyError for unknown IDs and ValueError for compounds.
+
+        """
+        if self._base.get_item(itemID).get_type():
+            raise ValueError('{0!r} is not a part'.format(itemID))
+        self._part_costs[itemID] = cost
+        self._forget()
+
+    def set_items(self, itemID, items):
+        """Override the items list of a compound.
+
+        scenario.set_items(str, list<(str, int)>) -> None
+
+        Raises KeyError for unknown IDs, ValueError if itemID is a part
+        and CycleError if the compound would contain itself.
+
+        """
+        if not self._base.get_item(itemID).get_type():
+            raise ValueError('{0!r} is not a compound'.format(itemID))
+        for component, _ in items:
+            self._base.get_item(component)
+        stack = [component for component, _ in items]
+        seen = set()
+        while stack:
+            component = stack.pop()
+            if component == itemID:
+                raise CycleError(itemID, '{0} would contain itself'.format(
+                    itemID))
+            if component not in seen:
+                seen.add(component)
+                stack.extend(child for child, _ in
+                             self.get_items_list(component))
+        self._items[itemID] = list(items)
+        self._forget()
+
+    def reset(self, itemID):
+        """Remove any override of an item, so that it matches the base.
+
+        scenario.reset(str) -> None
+
+        """
+        self._part_costs.pop(itemID, None)
+        self._items.pop(itemID, None)
+        self._forget()
+
+    def get_overrides(self):
+        """Returns the overridden part costs and compound items lists.
+
+        scenario.get_overrides() -> (dict(str, int),
+                                     dict(str, list<(str, int)>))
+
+        """
+        return dict(self._part_costs), dict(self._items)
+
+    def get_items_list(self, itemID):
+        """Returns the items list of an item in this scenario; parts have
+        no items.
+
+        scenario.get_items_list(str) -> list<(str, int)>
+
+        """
+        if itemID in self._items:
+            return self._items[itemID]
+        item = self._base.get_item(itemID)
+        if item.get_type():
+            return item.get_items_list()
+        return []
+
+    def get_cost(self, itemID):
+        """Returns the cost of an item in this scenario.
+
+        scenario.get_cost(str) -> int
+
+        """
+        self._check_base()
+        if itemID not in self._affected:
+            return self._base.get_cost(itemID)
+        costs = self._costs
+        cost = costs.get(itemID)
+        if cost is not None:
+            return cost
+        affected = self._affected
+        stack = [itemID]
+        while stack:
+            top = stack[-1]
+            if top in costs:
+                stack.pop()
+                continue
+            if top in self._part_costs:
+                costs[top] = self._part_costs[top]
+                stack.pop()
+                continue
+            items = self.get_items_list(top)
+            missing = [c for c, _ in items if c in affected and c not in costs]
+            if missing:
+                stack.extend(missing)
+                continue
+            cost = 0
+            for child, num in items:
+                if child in affected:
+                    cost += costs[child] * num
+                else:
+                    cost += self._base.get_cost(child) * num
+            costs[top] = cost
+            stack.pop()
+        return costs[itemID]
+
+    def get_costs(self):
+        """Returns a dictionary of the cost of every item in this scenario.
+
+        scenario.get_costs() -> dict(str, int)
+
+        """
+        costs = self._base.get_costs()
+        self._check_base()
+        for itemID in self._affected:
+            costs[itemID] = self.get_cost(itemID)
+        return costs
+
+    def _check_base(self):
+        """Drop the cached costs if the base has changed since they were
+        worked out, and find the affected items if need be."""
+        if self._version != self._base.get_version():
+            self._forget()
+            self._version = self._base.get_version()
+        if self._affected is None:
+            self._affected = self._find_affected()
+
+    def _find_affected(self):
+        """Return the overridden IDs and every compound above them.
+
+        Compounds whose items are overridden are affected themselves, so
+        the base's parents are enough to find the rest.
+        """
+        affected = set()
+        for itemID in list(self._part_costs) + list(self._items):
+            if itemID not in affected and self._base.has_item(itemID):
+                affected.add(itemID)
+                affected.update(self._base.where_used(itemID, True))
+        return affected
+
+
+def compare_costs(itemIDs, scenarios):
+    """Returns the cost of each item in each scenario, as one row of
+    costs per item.  A Products can be passed as a scenario to include
+    the base costs.
+
+    compare_costs(list<str>, list<Scenario>) -> list<(str, list<int>)>
+    """
+    return [(itemID, [scenario.get_cost(itemID) for scenario in scenarios])
+            for itemID in itemIDs]
+
+PROFILER.register(Scenario, 'get_cost')
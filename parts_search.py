@@ -0,0 +1,214 @@
+"""Prefix and substring search over the IDs and names of a Products
+dictionary, used to filter the Parts List window.
+
+    index = SearchIndex(products)
+    index.prefix('bike')     # IDs and names starting with 'bike'
+    index.search('wheel')    # IDs and names containing 'wheel'
+
+Searches ignore case.  The index follows edits made through products as a
+listener, but loading a file does not call listeners, so rebuild() it
+after a load.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from itertools import count, izip
+
+from parts_list import PROFILER
+
+# Substring queries at least this long are answered from the postings of
+# their trigrams; shorter ones have postings of their own.
+TRIGRAM = 3
+
+
+def trigrams(text):
+    """Return the set of TRIGRAM character slices of text.
+
+    trigrams(str) -> set(str)
+    """
+    return set([text[i:i + TRIGRAM]
+                for i in xrange(len(text) - TRIGRAM + 1)])
+
+
+def grams(text):
+    """Return the set of slices of text up to TRIGRAM characters long.
+
+    grams(str) -> set(str)
+    """
+    return set([text[i:i + size] for size in xrange(1, TRIGRAM + 1)
+                for i in xrange(len(text) - size + 1)])
+
+
+class SearchIndex(object):
+    """An index of the IDs and names in a Products dictionary.
+
+    Prefix queries bisect a sorted list of every lowercased ID and name.
+    Substring queries look up the items containing each trigram of the
+    query, check the items under the rarest trigram and so only touch
+    items that share that trigram with the query.  Queries shorter than
+    a trigram are found whole in the postings of their one and two
+    character slices.
+
+    Each item is given an ordinal when indexed; the postings of a slice
+    are an array of the ordinals of the items containing it.  Removed
+    items leave a gap in the ordinals, and the index is rebuilt once the
+    gaps outnumber the items.
+    """
+
+    def __init__(self, products):
+        """Index the items in products and follow its edits.
+
+        Constructor: SearchIndex(Products)
+        """
+        self._products = products
+        self.rebuild()
+        products.add_listener(self.item_changed)
+
+    def close(self):
+        """Stop following edits to the products dictionary.
+
+        index.close() -> None
+
+        """
+        self._products.remove_listener(self.item_changed)
+
+    def rebuild(self):
+        """Reindex every item in the products dictionary.
+
+        index.rebuild() -> None
+
+        """
+        get_item = self._products.get_item
+        # ordinal -> item ID, or None once removed
+        self._ids = self._products.get_keys()
+        # ordinal -> (lowercased ID, lowercased name), or None once removed
+        self._texts = [(itemID.lower(), get_item(itemID).get_name().lower())
+                       for itemID in self._ids]
+        self._ordinals = dict(izip(self._ids, count()))   # ID -> ordinal
+        self._removed = 0
+        postings = defaultdict(list)
+        for ordinal, texts in enumerate(self._texts):
+            for gram in grams(texts[0]) | grams(texts[1]):
+                postings[gram].append(ordinal)
+        # slice -> array of the ordinals of the items containing it
+        self._postings = dict((gram, array('i', ordinals))
+                              for gram, ordinals in postings.iteritems())
+        # every lowercased ID and name, sorted, and the item each is from
+        pairs = [(texts[0], itemID)
+                 for itemID, texts in izip(self._ids, self._texts)]
+        pairs.extend([(texts[1], itemID)
+                      for itemID, texts in izip(self._ids, self._texts)])
+        pairs.sort()
+        self._keys = [key for key, _ in pairs]
+        self._keyed = [itemID for _, itemID in pairs]
+
+    def item_changed(self, event, itemID, old, new):
+        """Products listener that keeps the index up to date.
+
+        index.item_changed(str, str, object, object) -> None
+
+        """
+        if event == 'add':
+            if old is not None:
+                self._remove(itemID)
+            self._add(itemID, new.get_name())
+        elif event == 'remove':
+            self._remove(itemID)
+        elif event == 'name':
+            self._remove(itemID)
+            self._add(itemID, new)
+        else:
+            return
+        if self._removed > len(self._ordinals):
+            self.rebuild()
+
+    def prefix(self, text):
+        """Returns the sorted IDs of the items whose ID or name starts
+        with text.
+
+        index.prefix(str) -> list<str>
+
+        """
+        text = text.lower()
+        keys = self._keys
+        found = set()
+        i = bisect_left(keys, text)
+        while i < len(keys) and keys[i].startswith(text):
+            found.add(self._keyed[i])
+            i += 1
+        return sorted(found)
+
+    def search(self, text):
+        """Returns the sorted IDs of the items whose ID or name contains
+        text.
+
+        index.search(str) -> list<str>
+
+        """
+        text = text.lower()
+        ids = self._ids
+        if not text:
+            return sorted(self._ordinals)
+        if len(text) < TRIGRAM:
+            found = [ids[ordinal]
+                     for ordinal in self._postings.get(text, ())
+                     if ids[ordinal] is not None]
+            found.sort()
+            return found
+        candidates = None
+        for gram in trigrams(text):
+            postings = self._postings.get(gram)
+            if postings is None:
+                return []
+            if candidates is None or len(postings) < len(candidates):
+                candidates = postings
+        texts = self._texts
+        found = []
+        for ordinal in candidates:
+            itemID = ids[ordinal]
+            if itemID is not None:
+                lowered = texts[ordinal]
+                if text in lowered[0] or text in lowered[1]:
+                    found.append(itemID)
+        found.sort()
+        return found
+
+    def _index(self, itemID, name):
+        """Give an item an ordinal and add it to the postings.
+        Returns its lowercased ID and name."""
+        ordinal = len(self._ids)
+        texts = (itemID.lower(), name.lower())
+        self._ids.append(itemID)
+        self._texts.append(texts)
+        self._ordinals[itemID] = ordinal
+        postings = self._postings
+        for gram in grams(texts[0]) | grams(texts[1]):
+            ordinals = postings.get(gram)
+            if ordinals is None:
+                ordinals = postings[gram] = array('i')
+            ordinals.append(ordinal)
+        return texts
+
+    def _add(self, itemID, name):
+        """Index a new item."""
+        for key in self._index(itemID, name):
+            i = bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._keyed.insert(i, itemID)
+
+    def _remove(self, itemID):
+        """Drop an item from the index, leaving a gap at its ordinal."""
+        ordinal = self._ordinals.pop(itemID)
+        for key in self._texts[ordinal]:
+            lo = bisect_left(self._keys, key)
+            hi = bisect_right(self._keys, key, lo)
+            i = self._keyed.index(itemID, lo, hi)
+            del self._keys[i]
+            del self._keyed[i]
+        self._ids[ordinal] = None
+        self._texts[ordinal] = None
+        self._removed += 1
+
+PROFILER.register(SearchIndex, 'prefix')
+PROFILER.register(SearchIndex, 'search')
@@ -0,0 +1,270 @@
+"""A local HTTP/JSON pricing service over a loaded Products dictionary.
+
+    GET  /items/ID                      the item and its rolled-up cost
+    GET  /items/ID/cost?qty=N           the rolled-up cost of N of the item
+    GET  /items/ID/where-used           the compounds listing the item;
+                                        ?transitive=1 includes those
+                                        containing it through others
+    POST /prices                        set part costs and names from a
+                                        JSON list of [ID, cost] or
+                                        [ID, cost, name] updates
+
+Errors are answered with {"error": message} and a 400 or 404 status.
+
+    python2 parts_list.py --serve items.txt --port 8765
+    curl http://127.0.0.1:8765/items/bike201/cost
+"""
+
+import json
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from Queue import Queue
+from contextlib import contextmanager
+from urllib import unquote
+
+# Threads answering requests, and the address served by default.
+SERVER_THREADS = 8
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+
+
+class ReadWriteLock(object):
+    """A lock held by any number of readers or by one writer.
+
+    Readers only take the internal lock to count themselves in and out,
+    so lookups and cost roll-ups run side by side.  A waiting writer
+    keeps new readers out, so that a stream of lookups cannot hold off a
+    price update for ever.
+    """
+
+    def __init__(self):
+        """Constructor: ReadWriteLock()"""
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0       # readers holding the lock
+        self._writers = 0       # writers holding or waiting for the lock
+        self._writing = False
+
+    @contextmanager
+    def reading(self):
+        """Hold the lock as a reader for the block.
+
+        with lock.reading(): ...
+        """
+        with self._cond:
+            while self._writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock as the only writer for the block.
+
+        with lock.writing(): ...
+        """
+        with self._cond:
+            self._writers += 1
+            while self._readers or self._writing:
+                self._cond.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._writers -= 1
+                self._cond.notify_all()
+
+
+def item_info(products, item):
+    """Return the JSON form of an item.
+
+    item_info(Products, Item) -> dict
+    """
+    itemID = item.get_ID()
+    info = {'id': itemID, 'name': item.get_name(),
+            'compound': item.get_type(), 'cost': products.get_cost(itemID)}
+    if item.get_type():
+        info['items'] = [[child, num] for child, num in item.get_items_list()]
+    return info
+
+
+def _text(value):
+    """Return a JSON string as a str, as the products file is bytes."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class PricingHandler(BaseHTTPRequestHandler):
+    """Answers the requests of one connection to a PricingServer."""
+
+    def do_GET(self):
+        url = urlparse.urlsplit(self.path)
+        path = [unquote(part) for part in url.path.strip('/').split('/')]
+        if len(path) not in (2, 3) or path[0] != 'items':
+            self._send(404, {'error': 'no such resource'})
+            return
+        # The answer is worked out under the lock and sent after it is
+        # released, so that slow clients do not hold up price updates.
+        with self.server.lock.reading():
+            status, body = self._lookup(path[1], path[2:],
+                                        urlparse.parse_qs(url.query))
+        self._send(status, body)
+
+    def _lookup(self, itemID, action, query):
+        """Return the status and body answering a GET of an item."""
+        products = self.server.products
+        item = products.get_item_or_none(itemID)
+        if item is None:
+            return 404, {'error': 'unknown item {0!r}'.format(itemID)}
+        if not action:
+            return 200, item_info(products, item)
+        if action == ['cost']:
+            try:
+                qty = int(query.get('qty', ['1'])[0])
+            except ValueError:
+                return 400, {'error': 'invalid quantity'}
+            return 200, {'id': itemID, 'qty': qty,
+                         'cost': products.get_cost(itemID) * qty}
+        if action == ['where-used']:
+            transitive = query.get('transitive', ['0'])[0] not in (
+                '0', '', 'false')
+            return 200, {'id': itemID, 'transitive': transitive,
+                         'used_in': products.where_used(itemID, transitive)}
+        return 404, {'error': 'no such resource'}
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/prices':
+            self._send(404, {'error': 'no such resource'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            updates = []
+            for update in json.loads(self.rfile.read(length)):
+                if len(update) == 2:
+                    itemID, cost = update
+                    name = None
+                else:
+                    itemID, cost, name = update
+                if not isinstance(itemID, basestring):
+                    raise ValueError('invalid ID {0!r}'.format(itemID))
+                if (not isinstance(cost, (int, long)) or
+                        isinstance(cost, bool)):
+                    raise ValueError('invalid cost {0!r}'.format(cost))
+                if name is not None and not isinstance(name, basestring):
+                    raise ValueError('invalid name {0!r}'.format(name))
+                updates.append((_text(itemID), cost, _text(name)))
+        except (TypeError, ValueError), e:
+            self._send(400, {'error': 'expected a list of [ID, cost] or '
+                                      '[ID, cost, name] updates: {0}'
+                                      .format(e)})
+            return
+        server = self.server
+        with server.lock.writing():
+            try:
+                changed = server.products.update_parts(updates)
+            except KeyError, e:
+                status, body = 404, {'error': 'unknown item {0!r}'.format(
+                    e.args[0])}
+            except ValueError, e:
+                status, body = 400, {'error': str(e)}
+            else:
+                if changed and server.save_to is not None:
+                    server.products.save_items(server.save_to)
+                status, body = 200, {'changed': changed}
+        self._send(status, body)
+
+    def _send(self, status, body):
+        """Send a JSON response."""
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class PricingServer(HTTPServer):
+    """An HTTP server answering from a pool of threads, which share one
+    Products dictionary under a ReadWriteLock.
+
+    Lookups and roll-ups hold the lock as readers.  Products.get_cost
+    fills its cost cache as it goes, but only ever adds the same cost for
+    an ID, so readers may do that side by side; only price updates, which
+    empty parts of the cache, need the lock to themselves.
+    """
+
+    def __init__(self, address, products, threads=SERVER_THREADS,
+                 save_to=None):
+        """Serve products on address, a (host, port) pair, from the given
+        number of threads.  If save_to is given the products are saved to
+        it after each update that changes them.
+
+        Constructor: PricingServer((str, int), Products, int, str)
+        """
+        HTTPServer.__init__(self, address, PricingHandler)
+        self.products = products
+        self.lock = ReadWriteLock()
+        self.save_to = save_to
+        self._requests = Queue()
+        self._workers = []
+        for _ in xrange(threads):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        """Hand an accepted connection to the pool."""
+        self._requests.put((request, client_address))
+
+    def _work(self):
+        """Answer connections until server_close."""
+        while True:
+            job = self._requests.get()
+            if job is None:
+                return
+            request, client_address = job
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        """Stop listening and stop the threads once they are idle.
+
+        server.server_close() -> None
+
+        """
+        HTTPServer.server_close(self)
+        for _ in self._workers:
+            self._requests.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+def serve(products, port=SERVER_PORT, threads=SERVER_THREADS, save_to=None,
+          host=SERVER_HOST):
+    """Serve products until interrupted.
+
+    serve(Products, int, int, str, str) -> None
+    """
+    products.get_costs()    # fill the cost cache before the first request
+    server = PricingServer((host, port), products, threads, save_to)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,602 @@
+"""A Products store kept in a SQLite database file.
+
+SQLiteProducts has the same methods for finding, pricing and editing
+items as Products, but keeps its items on disk, so a catalog that has
+been loaded once opens instantly and catalogs larger than memory can be
+priced:
+
+    products = SQLiteProducts('catalog.db')
+    products.load_items('catalog.txt')     # once
+    products.get_cost('bike101')
+
+Items are read from the database when asked for, edits are written
+through to it as they are made, each in its own transaction, and
+compound costs are rolled up by a recursive query that visits each
+compound below once.
+"""
+
+import os
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from parts_list import (JOURNAL_SUFFIX, PROFILER, PROGRESS_LINES,
+                        BaseProducts, Compound, CycleError, LoadError, Part,
+                        check_unresolved, gc_paused, intern_id, is_snapshot,
+                        iter_items, load_snapshot, replay_journal)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    cost INTEGER NOT NULL,      -- 0 for compounds
+    compound INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS components (
+    parent TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    child TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    PRIMARY KEY (parent, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS components_child ON components (child);
+"""
+
+# The components of each distinct compound below, and including, a
+# compound, with the cost and kind of each component (NULL if unknown).
+# UNION visits a compound shared by many sub-assemblies only once.
+SUBTREE = """
+WITH RECURSIVE tree(id) AS (
+    SELECT ?
+    UNION
+    SELECT components.child FROM components JOIN tree
+    ON components.parent = tree.id
+)
+SELECT components.parent, components.child, components.qty,
+       items.cost, items.compound
+FROM tree JOIN components ON components.parent = tree.id
+LEFT JOIN items ON items.id = components.child
+"""
+
+# The compounds that contain an item, directly or through other compounds.
+ANCESTORS = """
+WITH RECURSIVE up(id) AS (
+    SELECT parent FROM components WHERE child = ?
+    UNION
+    SELECT components.parent FROM components JOIN up
+    ON components.child = up.id
+)
+SELECT id FROM up ORDER BY id
+"""
+
+# Items kept in memory after they are read.
+ITEM_CACHE_SIZE = 10000
+
+# Rolled-up compound costs kept in memory; the cache is emptied when it
+# grows past this.
+COST_CACHE_SIZE = 100000
+
+# get_key reads the sorted IDs in pages of this many.
+KEY_PAGE_SIZE = 256
+
+
+class SQLiteProducts(BaseProducts):
+    """A Products dictionary stored in a SQLite database."""
+
+    def __init__(self, filename):
+        """Open, or create, the database in filename.  ':memory:' gives a
+        database that is not saved.
+
+        Constructor: SQLiteProducts(str)
+        """
+        # Transactions are begun explicitly, as the sqlite3 module would
+        # otherwise commit before every WITH query.
+        self._db = sqlite3.connect(filename, isolation_level=None)
+        self._db.text_factory = str
+        self._db.executescript(SCHEMA)
+        BaseProducts.__init__(self)
+        self._events = None             # changes to tell the listeners of
+                                        # when the open transaction commits
+        self._items = OrderedDict()     # recently read items, oldest first
+        self._costs = {}                # compound ID -> rolled-up cost
+        self._count = None              # number of items, once counted
+        self._page = (None, [])         # (first index, IDs) for get_key
+
+    def close(self):
+        """Close the database.
+
+        products.close() -> None
+
+        """
+        self._db.close()
+
+    def load_items(self, filename, processes=1, progress=None):
+        """Adds the Parts and Compounds in a products file or binary
+        snapshot to the database, then replays the file's journal if it
+        has one.  Either the whole file is added or, if it is malformed,
+        none of it.  processes is ignored and progress is called as by
+        load_items_from_file.
+
+        products.load_items(str, int, function) -> None
+
+        Raises LoadError if the file is malformed.
+
+        """
+        listeners, self._listeners = self._listeners, []
+        try:
+            with gc_paused():
+                if is_snapshot(filename):
+                    load_snapshot(self, filename)
+                else:
+                    self._import(filename, progress)
+            if os.path.exists(filename + JOURNAL_SUFFIX):
+                replay_journal(self, filename + JOURNAL_SUFFIX)
+        finally:
+            self._listeners = listeners
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block in one transaction, or in the one already open.
+        The changes are passed on to the listeners once it commits.  If
+        the block raises, the transaction is rolled back and the cached
+        items and costs, which may have been edited, are forgotten."""
+        if self._events is not None:
+            yield
+            return
+        self._events = []
+        self._db.execute('BEGIN')
+        try:
+            yield
+            self._db.commit()
+        except:
+            self._events = None
+            self._db.rollback()
+            self._items.clear()
+            self._costs = {}
+            self._changed()
+            raise
+        events, self._events = self._events, None
+        for event in events:
+            self._notify(*event)
+
+    def _import(self, filename, progress):
+        """Add the items of a products file in one transaction."""
+        db = self._db
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS lines '
+                   '(id TEXT PRIMARY KEY, lineno INTEGER) WITHOUT ROWID')
+        added = []
+        lineno = 0
+        committed = False
+        db.execute('BEGIN')
+        try:
+            for lineno, item_id, name, cost, items in iter_items(filename):
+                if progress is not None:
+                    if lineno % PROGRESS_LINES == 0:
+                        progress(lineno, added)
+                        added = []
+                    if items is None:
+                        added.append(Part(item_id, name, cost))
+                    else:
+                        added.append(Compound(item_id, name, self, items))
+                try:
+                    db.execute('INSERT INTO items VALUES (?, ?, ?, ?)',
+                               (item_id, name, cost or 0, items is not None))
+                except sqlite3.IntegrityError:
+                    raise LoadError(filename, lineno,
+                                    'duplicate item ID {0!r}'.format(item_id))
+                db.execute('INSERT INTO lines VALUES (?, ?)',
+                           (item_id, lineno))
+                if items:
+                    db.executemany(
+                        'INSERT INTO components VALUES (?, ?, ?, ?)',
+                        [(item_id, n, child, qty)
+                         for n, (child, qty) in enumerate(items)])
+            if progress is not None:
+                progress(lineno, added)
+            unresolved = dict(db.execute(
+                'SELECT child, MIN(lineno) FROM components '
+                'JOIN lines ON lines.id = components.parent '
+                'WHERE child NOT IN (SELECT id FROM items) GROUP BY child'))
+            check_unresolved(filename, unresolved)
+            cyclic = self._find_cycle()
+            if cyclic is not None:
+                row = db.execute('SELECT lineno FROM lines WHERE id = ?',
+                                 (cyclic,)).fetchone()
+                raise LoadError(filename, row[0] if row else 0,
+                                '{0} contains itself'.format(cyclic))
+            db.commit()
+            committed = True
+        finally:
+            if not committed:
+                db.rollback()
+            db.execute('DROP TABLE temp.lines')
+            self._changed()
+
+    def _find_cycle(self):
+        """Return the ID of a compound that contains itself, or None."""
+        children = {}
+        waiting = {}    # compound ID -> compounds in it not yet ordered
+        for parent, child in self._db.execute(
+                'SELECT DISTINCT parent, child FROM components '
+                'JOIN items ON items.id = components.child '
+                'WHERE items.compound'):
+            children.setdefault(child, []).append(parent)
+            waiting[parent] = waiting.get(parent, 0) + 1
+        ready = [c for c in children if c not in waiting]
+        while ready:
+            for parent in children.get(ready.pop(), ()):
+                waiting[parent] -= 1
+                if not waiting[parent]:
+                    del waiting[parent]
+                    ready.append(parent)
+        if waiting:
+            return min(waiting)
+        return None
+
+    def get_item(self, itemID):
+        """Returns the item with the given ID.  Raises KeyError if there
+        is no such item.
+
+        products.get_item(str) -> Item
+
+        """
+        item = self.get_item_or_none(itemID)
+        if item is None:
+            raise KeyError(itemID)
+        return item
+
+    def get_item_or_none(self, itemID):
+        """Returns the item with the given ID, or None if there is none.
+
+        products.get_item_or_none(str) -> Item
+
+        """
+        item = self._items.pop(itemID, None)
+        if item is None:
+            row = self._db.execute(
+                'SELECT name, cost, compound FROM items WHERE id = ?',
+                (itemID,)).fetchone()
+            if row is None:
+                return None
+            name, cost, compound = row
+            if compound:
+                item = Compound(itemID, name, self, self._db.execute(
+                    'SELECT child, qty FROM components WHERE parent = ? '
+                    'ORDER BY position', (itemID,)).fetchall())
+            else:
+                item = Part(itemID, name, cost)
+                item._products = self
+        self._cache(itemID, item)
+        return item
+
+    def _cache(self, itemID, item):
+        """Make item the cached, and so the only live, item for itemID."""
+        self._items.pop(itemID, None)
+        if len(self._items) >= ITEM_CACHE_SIZE:
+            self._items.popitem(last=False)
+        self._items[itemID] = item
+
+    def has_item(self, itemID):
+        """Returns True if there is an item with the given ID.
+
+        products.has_item(str) -> bool
+
+        """
+        return self._db.execute('SELECT 1 FROM items WHERE id = ?',
+                                (itemID,)).fetchone() is not None
+
+    def add_item(self, itemID, item):
+        """Adds an item, replacing any item with the same ID.
+
+        products.add_item(str, Item) -> None
+
+        Raises CycleError if a compound would contain itself.
+
+        """
+        old = self.get_item_or_none(itemID)
+        if item.get_type():
+            self.check_cycle(itemID, item.get_items_list())
+        with self._transaction():
+            self._invalidate(itemID)
+            self._delete(itemID)
+            self._insert(itemID, item)
+            self._cache(itemID, item)
+            self._changed()
+            self._notify('add', itemID, old, item)
+
+    def add_items(self, items):
+        """Adds a list of (item ID, item) pairs with distinct IDs in one
+        transaction.
+
+        products.add_items(list<(str, Item)>) -> None
+
+        Raises CycleError, and adds nothing, if any compound would contain
+        itself.
+
+        """
+        with self._transaction():
+            for itemID, item in items:
+                self._delete(itemID)
+                self._insert(itemID, item)
+            cyclic = self._find_cycle()
+            if cyclic is not None:
+                raise CycleError(cyclic,
+                                 '{0} cannot contain itself'.format(cyclic))
+            self._costs = {}
+            self._items.clear()
+            self._changed()
+            for itemID, item in items:
+                self._notify('add', itemID, None, item)
+
+    def _insert(self, itemID, item):
+        """Write an item's rows."""
+        item._products = self
+        compound = item.get_type()
+        self._db.execute('INSERT INTO items VALUES (?, ?, ?, ?)',
+                         (itemID, item.get_name(),
+                          0 if compound else item.get_cost(), compound))
+        if compound:
+            self._db.executemany(
+                'INSERT INTO components VALUES (?, ?, ?, ?)',
+                [(itemID, n, child, qty)
+                 for n, (child, qty) in enumerate(item.get_items_list())])
+
+    def _delete(self, itemID):
+        """Delete an item's rows."""
+        self._db.execute('DELETE FROM items WHERE id = ?', (itemID,))
+        self._db.execute('DELETE FROM components WHERE parent = ?', (itemID,))
+
+    def remove_item(self, itemID):
+        """Deletes an item.  Raises KeyError if there is no such item.
+
+        products.remove_item(str) -> None
+
+        """
+        item = self.get_item(itemID)
+        with self._transaction():
+            self._invalidate(itemID)
+            self._delete(itemID)
+            del self._items[itemID]
+            self._changed()
+            self._notify('remove', itemID, item, None)
+
+    def delete_all(self):
+        """Deletes every item.
+
+        products.delete_all() -> None
+
+        """
+        with self._transaction():
+            self._db.execute('DELETE FROM components')
+            self._db.execute('DELETE FROM items')
+        self._items.clear()
+        self._costs = {}
+        self._changed()
+
+    def update_parts(self, updates):
+        """Apply a list of (item ID, cost, name) updates to parts as one
+        change, as Products.update_parts does, in one transaction that is
+        rolled back if any update fails.  Returns the IDs of the parts
+        that changed.
+
+        products.update_parts(list<(str, int, str)>) -> list<str>
+
+        Raises KeyError for unknown IDs and ValueError if a cost is given
+        for a compound.
+
+        """
+        with self._transaction():
+            return BaseProducts.update_parts(self, updates)
+
+    def item_changed(self, item, attribute, old):
+        """Called by an item after its 'name', 'cost' or 'items' attribute
+        is changed from old; writes the change to the database and tells
+        the listeners.  The edited item becomes the one get_item returns,
+        replacing any copy read after it was dropped from the cache.
+        Edits to removed items are ignored.
+
+        products.item_changed(Item, str, object) -> None
+
+        """
+        itemID = item.get_ID()
+        if self._items.get(itemID) is not item and not self.has_item(itemID):
+            return
+        if attribute == 'items' and self._items.get(itemID) is not item:
+            # Compound.set_items only checks items still in the cache.
+            try:
+                self.check_cycle(itemID, item.get_items_list())
+            except CycleError:
+                item._pack(old)
+                raise
+        with self._transaction():
+            self._cache(itemID, item)
+            if attribute == 'name':
+                new = item.get_name()
+                self._db.execute('UPDATE items SET name = ? WHERE id = ?',
+                                 (new, itemID))
+            elif attribute == 'cost':
+                new = item.get_cost()
+                self._invalidate(itemID)
+                self._db.execute('UPDATE items SET cost = ? WHERE id = ?',
+                                 (new, itemID))
+            else:
+                new = item.get_items_list()
+                self._invalidate(itemID)
+                self._db.execute('DELETE FROM components WHERE parent = ?',
+                                 (itemID,))
+                self._db.executemany(
+                    'INSERT INTO components VALUES (?, ?, ?, ?)',
+                    [(itemID, n, child, qty)
+                     for n, (child, qty) in enumerate(new)])
+            self._notify(attribute, itemID, old, new)
+
+    def check_cycle(self, itemID, items):
+        """Raise CycleError if giving itemID the components in items would
+        make it contain itself.
+
+        products.check_cycle(str, list<(str, int)>) -> None
+
+        """
+        depend = set(i[0] for i in items)
+        if itemID in depend:
+            raise CycleError(itemID,
+                             '{0} cannot contain itself'.format(itemID))
+        for parent in self.where_used(itemID, True):
+            if parent in depend:
+                raise CycleError(itemID, '{0} already contains {1}'.format(
+                    parent, itemID))
+
+    def get_cost(self, itemID):
+        """Returns the rolled-up cost of an item.  Raises KeyError if the
+        item, or any item in it, is unknown.
+
+        products.get_cost(str) -> int
+
+        """
+        cost = self._costs.get(itemID)
+        if cost is not None:
+            return cost
+        row = self._db.execute('SELECT cost, compound FROM items WHERE id = ?',
+                               (itemID,)).fetchone()
+        if row is None:
+            raise KeyError(itemID)
+        if not row[1]:
+            return row[0]
+        return self._rollup(itemID)
+
+    def _rollup(self, itemID):
+        """Price a compound and the compounds below it, each once, from
+        the components read by SUBTREE, and cache their costs."""
+        components = {}     # compound ID -> [(child, qty, cost, compound)]
+        for parent, child, qty, cost, compound in self._db.execute(
+                SUBTREE, (itemID,)):
+            if compound is None:
+                raise KeyError(child)
+            components.setdefault(parent, []).append(
+                (child, qty, cost, compound))
+        if len(self._costs) + len(components) >= COST_CACHE_SIZE:
+            self._costs = {}
+        costs = self._costs
+        stack = [itemID]
+        while stack:
+            top = stack[-1]
+            if top in costs:
+                stack.pop()
+                continue
+            missing = [child for child, _, _, compound
+                       in components.get(top, ())
+                       if compound and child not in costs]
+            if missing:
+                stack.extend(missing)
+                continue
+            costs[top] = sum(qty * (costs[child] if compound else cost)
+                             for child, qty, cost, compound
+                             in components.get(top, ()))
+            stack.pop()
+        return costs[itemID]
+
+    def get_costs(self):
+        """Returns a dictionary of the rolled-up cost of every item.
+
+        products.get_costs() -> dict(str, int)
+
+        """
+        costs = {}
+        for itemID, cost, compound in self._db.execute(
+                'SELECT id, cost, compound FROM items').fetchall():
+            costs[itemID] = self.get_cost(itemID) if compound else cost
+        return costs
+
+    def _invalidate(self, itemID):
+        """Forget the cached costs of an item and the compounds above it."""
+        self._costs.pop(itemID, None)
+        if self._costs:
+            for parent in self.where_used(itemID, True):
+                self._costs.pop(parent, None)
+
+    def where_used(self, itemID, transitive=False):
+        """Returns the IDs of the compounds that list itemID as a component.
+        If transitive is True, compounds that contain it through other
+        compounds are included as well.
+
+        products.where_used(str, bool) -> list<str>
+
+        """
+        if transitive:
+            query = ANCESTORS
+        else:
+            query = ('SELECT DISTINCT parent FROM components WHERE child = ? '
+                     'ORDER BY parent')
+        return [row[0] for row in self._db.execute(query, (itemID,))]
+
+    def check_depend(self, itemID):
+        """Returns True if any compound lists itemID as a component.
+
+        products.check_depend(str) -> bool
+
+        """
+        return self._db.execute('SELECT 1 FROM components WHERE child = ? '
+                                'LIMIT 1', (itemID,)).fetchone() is not None
+
+    def get_keys(self):
+        """Returns every item ID in sorted order.
+
+        products.get_keys() -> list<str>
+
+        """
+        return [intern_id(row[0]) for row in
+                self._db.execute('SELECT id FROM items ORDER BY id')]
+
+    def get_key(self, index):
+        """Returns the item ID at the given position in sorted order.
+
+        products.get_key(int) -> str
+
+        """
+        start = index - index % KEY_PAGE_SIZE
+        if self._page[0] != start:
+            self._page = (start, [row[0] for row in self._db.execute(
+                'SELECT id FROM items ORDER BY id LIMIT ? OFFSET ?',
+                (KEY_PAGE_SIZE, start))])
+        return self._page[1][index - start]
+
+    def position_of(self, itemID):
+        """Returns the position itemID has in sorted ID order, or would
+        have if it were added.
+
+        products.position_of(str) -> int
+
+        """
+        return self._db.execute('SELECT COUNT(*) FROM items WHERE id < ?',
+                                (itemID,)).fetchone()[0]
+
+    def get_count(self):
+        """Returns the number of items.
+
+        products.get_count() -> int
+
+        """
+        if self._count is None:
+            self._count = self._db.execute(
+                'SELECT COUNT(*) FROM items').fetchone()[0]
+        return self._count
+
+    def _changed(self):
+        """Note that items were added or removed: forget the item count
+        and the page of sorted IDs, and bump the version."""
+        self._count = None
+        self._page = (None, [])
+        self._version += 1
+
+    def _notify(self, event, itemID, old, new):
+        """Pass a change on to the listeners, or hold it until the open
+        transaction commits."""
+        if self._events is not None:
+            self._events.append((event, itemID, old, new))
+        else:
+            BaseProducts._notify(self, event, itemID, old, new)
+
+for _attribute in ['get_cost', 'get_costs', 'get_keys', 'get_key',
+                   'load_items', 'save_items']:
+    PROFILER.register(SQLiteProducts, _attribute)
+del _attribute
@@ -0,0 +1,57 @@
+"""Tests of comparing two products files.
+
+    python2 -m unittest test_parts_diff
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from parts_diff import diff_catalogs
+from parts_list import LoadError
+
+
+class DiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='test_parts_diff')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write(self, name, lines):
+        """Write a products file and return its name."""
+        filename = os.path.join(self.workdir, name)
+        f = open(filename, 'w')
+        f.write('\n'.join(lines) + '\n')
+        f.close()
+        return filename
+
+    def test_costs(self):
+        old = self.write('old.txt', ['P, p, 1', 'Q, q, 2', 'A, a, P:2,Q:1',
+                                     'B, b, A:3'])
+        new = self.write('new.txt', ['P, p, 5', 'Q, q, 2', 'A, a, P:2,Q:1',
+                                     'B, b, A:3', 'R, r, 7'])
+        diff = diff_catalogs(old, new)
+        self.assertEqual(diff.added, ['R'])
+        self.assertEqual(diff.removed, [])
+        self.assertEqual(diff.changed, ['P'])
+        self.assertEqual(diff.costs, [('A', 4, 12), ('B', 12, 36)])
+
+    def test_cycle(self):
+        old = self.write('old.txt', ['P, p, 1', 'A, a, B:1', 'B, b, A:1,P:1'])
+        new = self.write('new.txt', ['P, p, 2', 'A, a, B:1', 'B, b, A:1,P:1'])
+        with self.assertRaises(LoadError) as raised:
+            diff_catalogs(old, new)
+        self.assertIn('contains itself', str(raised.exception))
+        loop = self.write('loop.txt', ['P, p, 1', 'A, a, A:1,P:1'])
+        self.assertRaises(LoadError, diff_catalogs, old, loop)
+        # a cycle away from the changed items is found as well
+        old = self.write('old.txt', ['P, p, 1', 'A, a, B:1', 'B, b, A:1'])
+        new = self.write('new.txt', ['P, p, 2', 'A, a, B:1', 'B, b, A:1'])
+        self.assertRaises(LoadError, diff_catalogs, old, new)
+
+
+if __name__ == '__main__':
+    unittest.main()
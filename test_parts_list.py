@@ -0,0 +1,75 @@
+"""Tests of loading and saving products files.
+
+    python2 -m unittest test_parts_list
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from parts_list import (JOURNAL_SUFFIX, Compound, Part, Products,
+                        save_items_to_file)
+
+CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'items.txt')
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='test_parts_list')
+        self.filename = os.path.join(self.workdir, 'items.txt')
+        shutil.copy(CATALOG, self.filename)
+        self.products = Products()
+        self.products.load_items(self.filename)
+        self.products.open_journal(self.filename)
+
+    def tearDown(self):
+        self.products.close_journal()
+        shutil.rmtree(self.workdir)
+
+    def reload(self):
+        """Save the journal and return the file loaded afresh."""
+        self.products.save_items(self.filename)
+        self.assertTrue(os.path.exists(self.filename + JOURNAL_SUFFIX))
+        products = Products()
+        products.load_items(self.filename)
+        return products
+
+    def test_added_compounds(self):
+        products = self.products
+        products.add_item('KIT1', Compound('KIT1', 'Wheel kit', products,
+                                           [('WH239', 2), ('TR202', 2)]))
+        products.add_item('KIT2', Compound('KIT2', 'Empty kit', products, []))
+        loaded = self.reload()
+        self.assertTrue(loaded.get_item('KIT1').get_type())
+        self.assertEqual(loaded.get_item('KIT1').get_items_list(),
+                         [('WH239', 2), ('TR202', 2)])
+        self.assertTrue(loaded.get_item('KIT2').get_type())
+        self.assertEqual(loaded.get_item('KIT2').get_items_list(), [])
+        self.assertEqual(loaded.get_cost('KIT1'), products.get_cost('KIT1'))
+
+    def test_round_trip(self):
+        products = self.products
+        products.add_item('XX1', Part('XX1', 'Spoke', 30))
+        products.add_item('KIT1', Compound('KIT1', 'Wheel kit', products,
+                                           [('WH239', 2), ('XX1', 36)]))
+        products.get_item('TR202').set_cost(2100)
+        products.get_item('WH239').set_name('Wheel')
+        products.get_item('KIT1').set_items([('XX1', 32), ('TR202', 1)])
+        products.remove_item('bike301')
+        loaded = self.reload()
+        journal = open(self.filename + JOURNAL_SUFFIX).read()
+        self.assertEqual(sorted(set(line.split(',')[0]
+                                    for line in journal.splitlines())),
+                         ['+', '-', 'C', 'I', 'N'])
+        rewritten = os.path.join(self.workdir, 'rewritten.txt')
+        replayed = os.path.join(self.workdir, 'replayed.txt')
+        save_items_to_file(products, rewritten)
+        save_items_to_file(loaded, replayed)
+        self.assertEqual(open(replayed).read(), open(rewritten).read())
+
+
+if __name__ == '__main__':
+    unittest.main()
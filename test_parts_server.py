@@ -0,0 +1,156 @@
+"""Tests of the pricing service, run against a server on localhost.
+
+    python2 -m unittest test_parts_server
+"""
+
+import json
+import os
+import threading
+import time
+import unittest
+import urllib2
+
+from parts_list import Products
+from parts_server import PricingHandler, PricingServer, ReadWriteLock
+
+CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'items.txt')
+
+
+class QuietHandler(PricingHandler):
+    """A handler that does not log each request."""
+
+    def log_message(self, *args):
+        pass
+
+
+class PricingServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.products = Products()
+        self.products.load_items(CATALOG)
+        self.server = PricingServer(('127.0.0.1', 0), self.products, 2)
+        self.server.RequestHandlerClass = QuietHandler
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def request(self, path, body=None):
+        """Return the status and decoded JSON body of a request."""
+        try:
+            response = urllib2.urlopen(self.base + path, body)
+        except urllib2.HTTPError, e:
+            response = e
+        try:
+            return response.code, json.load(response)
+        finally:
+            response.close()
+
+    def test_item(self):
+        status, body = self.request('/items/bike201')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['name'], 'Mountain Bike')
+        self.assertTrue(body['compound'])
+        self.assertEqual(body['cost'], self.products.get_cost('bike201'))
+        self.assertEqual(body['items'][0], ['WH239', 2])
+
+    def test_cost(self):
+        status, body = self.request('/items/bike201/cost?qty=3')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['cost'], 3 * self.products.get_cost('bike201'))
+        self.assertEqual(self.request('/items/bike201/cost?qty=x')[0], 400)
+
+    def test_where_used(self):
+        status, body = self.request('/items/WH239/where-used')
+        self.assertEqual(body['used_in'], self.products.where_used('WH239'))
+        status, body = self.request('/items/WH239/where-used?transitive=1')
+        self.assertEqual(body['used_in'],
+                         self.products.where_used('WH239', True))
+
+    def test_not_found(self):
+        self.assertEqual(self.request('/items/nope')[0], 404)
+        self.assertEqual(self.request('/items/bike201/nope')[0], 404)
+        self.assertEqual(self.request('/nope')[0], 404)
+
+    def test_update_prices(self):
+        before = self.products.get_cost('bike201')
+        status, body = self.request('/prices', json.dumps(
+            [['WH239', 5500], ['TR202', 2000, 'Tire']]))
+        self.assertEqual(status, 200)
+        self.assertEqual(body['changed'], ['WH239', 'TR202'])
+        self.assertEqual(self.request('/items/bike201/cost')[1]['cost'],
+                         before + 1000)
+        self.assertEqual(self.products.get_item('TR202').get_name(), 'Tire')
+
+    def test_bad_updates(self):
+        for body in ['not json', '[["WH239"]]', '[["WH239", "x"]]',
+                     '[["WH239", 5, 6]]', '[[["WH239"], 5]]', '[5]']:
+            self.assertEqual(self.request('/prices', body)[0], 400, body)
+        self.assertEqual(self.request('/prices', '[["nope", 5]]')[0], 404)
+        self.assertEqual(self.request('/prices', '[["bike201", 5]]')[0], 400)
+        self.assertEqual(self.products.get_item('WH239').get_cost(), 5000)
+
+
+class ReadWriteLockTest(unittest.TestCase):
+
+    def test_readers_share(self):
+        lock = ReadWriteLock()
+        inside = threading.Semaphore(0)
+        release = threading.Event()
+
+        def reader():
+            with lock.reading():
+                inside.release()
+                release.wait()
+        readers = [threading.Thread(target=reader) for _ in xrange(3)]
+        for thread in readers:
+            thread.start()
+        for _ in readers:   # every reader gets in while the others hold it
+            inside.acquire()
+        release.set()
+        for thread in readers:
+            thread.join()
+
+    def test_writer_excludes_readers(self):
+        lock = ReadWriteLock()
+        events = []
+        reading = threading.Event()
+        release = threading.Event()
+
+        def reader():
+            with lock.reading():
+                reading.set()
+                release.wait()
+                events.append('read')
+
+        def writer():
+            with lock.writing():
+                events.append('write')
+
+        def late_reader():
+            with lock.reading():
+                events.append('late read')
+        first = threading.Thread(target=reader)
+        first.start()
+        reading.wait()
+        second = threading.Thread(target=writer)
+        second.start()
+        while not lock._writers:    # the writer is waiting
+            time.sleep(0.001)
+        third = threading.Thread(target=late_reader)
+        third.start()
+        time.sleep(0.05)
+        self.assertEqual(events, [])
+        release.set()
+        for thread in (first, second, third):
+            thread.join()
+        self.assertEqual(events, ['read', 'write', 'late read'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Tests of the SQLite products store.
+
+    python2 -m unittest test_parts_sqlite
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from parts_list import Products
+from parts_search import SearchIndex
+from parts_sqlite import SQLiteProducts
+
+CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'items.txt')
+
+
+class SQLiteProductsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.products = SQLiteProducts(':memory:')
+        self.products.load_items(CATALOG)
+        self.events = []
+        self.products.add_listener(
+            lambda event, itemID, old, new: self.events.append(itemID))
+
+    def tearDown(self):
+        self.products.close()
+
+    def test_costs(self):
+        products = Products()
+        products.load_items(CATALOG)
+        self.assertEqual(self.products.get_costs(), products.get_costs())
+
+    def test_update_parts(self):
+        before = self.products.get_cost('bike201')
+        self.assertEqual(self.products.update_parts(
+            [('WH239', 5500, None), ('TR202', 2000, 'Tire')]),
+            ['WH239', 'TR202'])
+        self.assertEqual(self.events, ['WH239', 'TR202'])
+        self.assertEqual(self.products.get_cost('bike201'), before + 1000)
+        self.assertEqual(self.products.get_item('TR202').get_name(), 'Tire')
+
+    def test_update_parts_rolls_back(self):
+        before = self.products.get_cost('bike201')
+        # SQLite cannot store the second cost, so the batch fails there
+        self.assertRaises(OverflowError, self.products.update_parts,
+                          [('WH239', 5500, 'Wheel'), ('TR202', 2 ** 70, None)])
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.products.get_item('WH239').get_cost(), 5000)
+        self.assertEqual(self.products.get_item('WH239').get_name(),
+                         'Mountain Bike Wheel')
+        self.assertEqual(self.products.get_cost('bike201'), before)
+
+    def test_journal(self):
+        workdir = tempfile.mkdtemp(prefix='test_parts_sqlite')
+        try:
+            filename = os.path.join(workdir, 'items.txt')
+            shutil.copy(CATALOG, filename)
+            self.products.open_journal(filename)
+            self.products.get_item('WH239').set_cost(5500)
+            self.products.save_items(filename)
+            self.products.close_journal()
+            products = Products()
+            products.load_items(filename)
+            self.assertEqual(products.get_item('WH239').get_cost(), 5500)
+        finally:
+            shutil.rmtree(workdir)
+
+    def test_search(self):
+        index = SearchIndex(self.products)
+        self.assertEqual(index.search('wheel'), ['WH139', 'WH239', 'WH339'])
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()